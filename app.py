@@ -1,60 +1,357 @@
 import os
 import time
-import json
 import re
 import shutil
-import markdown
-import zipfile
-import io
+import zlib
+import threading
+import unicodedata
+from urllib.parse import quote
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash
+from flask import Flask, render_template, get_template_attribute, request, redirect, url_for, send_file, flash, jsonify, abort, Response, stream_with_context, g
+from metadata_store import open_store, migrate_json, migrate_to_paths, make_key, SqliteMetadataStore
+from dir_tree import DirTree
+from render_cache import RenderCache
+from markdown_pipeline import MarkdownPipeline
+import search_index as search_index_module
+from search_index import SearchIndex
+from zip_stream import iter_entries, stream_zip
+from chunked_upload import ChunkedUploads, UploadError
+from listing import scan_directory, paginate, CursorError
+from http_cache import file_validators, apply_cache_policy, not_modified
+from jobs import JobQueue, JobCancelled, DONE
+from blob_store import BlobStore, dedupe_tree
+from history import VersionHistory
+from file_lock import FileLock
+import metrics
 
 app = Flask(__name__)
-app.secret_key = 'some_secret_key'
+app.secret_key = os.environ.get('SECRET_KEY', 'some_secret_key')
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'upload_folder')
-METADATA_FILE = os.path.join(BASE_DIR, 'metadata.json')
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-def load_metadata():
-    if os.path.exists(METADATA_FILE):
-        with open(METADATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    else:
-        data = {}
-    return data
-
-def save_metadata(data):
-    with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-
+# 数据目录 (笔记、元数据、索引、缓存)，多个 worker 进程共享同一个
+DATA_DIR = os.environ.get('DATA_DIR', BASE_DIR)
+UPLOAD_FOLDER = os.path.join(DATA_DIR, 'upload_folder')
+METADATA_FILE = os.path.join(DATA_DIR, 'metadata.json')
+METADATA_DB = os.path.join(DATA_DIR, 'metadata.db')
+# 元数据后端: sqlite(默认, 按记录更新) 或 json(旧的整文件读写)
+METADATA_BACKEND = os.environ.get('METADATA_BACKEND', 'sqlite')
+# 目录树缓存检查目录 mtime 的最小间隔(秒)，用于发现应用外的修改
+DIR_TREE_CHECK_INTERVAL = float(os.environ.get('DIR_TREE_CHECK_INTERVAL', '2'))
+# 渲染缓存的内存预算(字节)；RENDER_CACHE_DIR 非空时同时持久化到磁盘
+RENDER_CACHE_BYTES = int(os.environ.get('RENDER_CACHE_BYTES', str(32 * 1024 * 1024)))
+RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', '')
+# Markdown 扩展 (逗号分隔)；codehilite 需要安装 pygments，MARKDOWN_CODE_STYLE 为 pygments 的配色名
+MARKDOWN_EXTENSIONS = os.environ.get('MARKDOWN_EXTENSIONS', 'tables,fenced_code,codehilite,toc')
+MARKDOWN_CODE_STYLE = os.environ.get('MARKDOWN_CODE_STYLE', 'default')
+SEARCH_DB = os.path.join(DATA_DIR, 'search.db')
+# 分块上传的临时目录需与 UPLOAD_FOLDER 在同一文件系统，提交时才能原子改名
+UPLOAD_TMP_FOLDER = os.path.join(DATA_DIR, 'upload_tmp')
+MAX_CONCURRENT_UPLOADS = int(os.environ.get('MAX_CONCURRENT_UPLOADS', '4'))
+MAX_CHUNK_BYTES = int(os.environ.get('MAX_CHUNK_BYTES', str(8 * 1024 * 1024)))
+# 目录列表每页条数 (首页渲染第一页，其余由 /api/list 分页加载)
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', '200'))
+# 后台任务: 含文件夹或超过 JOB_INLINE_LIMIT 项的批量删除/移动交给任务队列
+JOBS_DB = os.path.join(DATA_DIR, 'jobs.db')
+JOB_OUTPUT_FOLDER = os.path.join(DATA_DIR, 'job_output')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_INLINE_LIMIT = int(os.environ.get('JOB_INLINE_LIMIT', '20'))
+# 笔记锁: 按路径哈希分到固定数量的锁文件上，同一笔记跨进程互斥，不同笔记基本互不阻塞
+NOTE_LOCK_FOLDER = os.path.join(DATA_DIR, 'note_locks')
+NOTE_LOCK_STRIPES = int(os.environ.get('NOTE_LOCK_STRIPES', '64'))
+# 已结束的任务记录和导出文件保留的天数
+JOB_RETENTION_DAYS = float(os.environ.get('JOB_RETENTION_DAYS', '7'))
+# 去重存储: 笔记内容按 sha256 存一份，目录树里是指向它的硬链接 (需与 UPLOAD_FOLDER 同一文件系统)
+BLOB_FOLDER = os.path.join(DATA_DIR, 'blobs')
+# 版本历史: 差异存储，每 HISTORY_KEYFRAME_INTERVAL 个版本一个完整关键帧；
+# 保留最近 HISTORY_MAX_REVISIONS 个版本 / HISTORY_MAX_AGE_DAYS 天内的版本 (0 表示不限)
+HISTORY_DB = os.path.join(DATA_DIR, 'history.db')
+HISTORY_KEYFRAME_INTERVAL = int(os.environ.get('HISTORY_KEYFRAME_INTERVAL', '50'))
+HISTORY_MAX_REVISIONS = int(os.environ.get('HISTORY_MAX_REVISIONS', '0'))
+HISTORY_MAX_AGE_DAYS = int(os.environ.get('HISTORY_MAX_AGE_DAYS', '0'))
+# 指标与分析: 指标在 /metrics 导出；SERVER_TIMING=1 时每个响应带 Server-Timing 头；
+# PROFILE_SLOW_MS > 0 时开启采样分析，耗时超过它的请求把采样栈写到 PROFILE_FOLDER
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_FOLDER = os.path.join(DATA_DIR, 'profiles')
+# 静态站点导出 (flask export-site) 的输出目录；EXPORT_WORKERS 为渲染进程数，0 表示按 CPU 核数
+EXPORT_FOLDER = os.environ.get('EXPORT_FOLDER', os.path.join(DATA_DIR, 'static_site'))
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '0'))
+# 启动预热: create_app() 默认把元数据、目录树、模板、渲染管线一次性加载好，第一个请求不必付这部分开销；
+# LAZY_START=1 时跳过预热，全部推迟到第一次用到 (适合 serverless 冷启动、只跑 CLI 命令)
+LAZY_START = os.environ.get('LAZY_START', '0') == '1'
+PRELOAD_TEMPLATES = ('index.html', '_rows.html')
+
+VALID_NAME_RE = re.compile(r'^[A-Za-z0-9._-]+$')
+
+# 运行期状态由 create_app() 在每个进程里初始化一次
+metadata_store = None
+dir_tree = None
+markdown_pipeline = None
+render_cache = None
+search_index = None
+chunked_uploads = None
+job_queue = None
+jobs_resumed = False
+blob_store = None
+version_history = None
+# 笔记的 检查-写入 (新建、编辑) 跨进程互斥，见 note_lock()
+note_locks = None
+profiler = None
+# 进程内的初始化只做一次: 多线程服务器上并发的第一批请求都会调用 create_app()
+init_lock = threading.Lock()
+
+def create_app():
+    # WSGI 入口，每个 worker 进程调用一次，例如:
+    #   gunicorn -w 4 -b 0.0.0.0:5000 'app:create_app()'
+    #   waitress-serve --call app:create_app
+    if metadata_store is not None:
+        return app
+    with init_lock:
+        if metadata_store is None:
+            init_state()
+    return app
+
+def init_state():
+    global metadata_store, dir_tree, markdown_pipeline, render_cache, search_index, chunked_uploads, job_queue
+    global blob_store, version_history, note_locks, profiler
+    for path in (DATA_DIR, UPLOAD_FOLDER, JOB_OUTPUT_FOLDER):
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+    # 多个 worker 同时启动时，迁移和首次建索引只由一个进程完成
+    with FileLock(os.path.join(DATA_DIR, 'init.lock')):
+        # 首次使用 sqlite 后端时会自动从 metadata.json 迁移
+        store = open_store(METADATA_BACKEND, METADATA_FILE, METADATA_DB)
+        # 旧记录以文件名为 key，迁移为以相对路径为 key
+        migrate_to_paths(store, UPLOAD_FOLDER)
+
+        # 全文索引随上传/新建/编辑/删除/重命名/移动增量更新；首次启动时全量建立
+        need_search_build = not os.path.exists(SEARCH_DB)
+        search_index = SearchIndex(SEARCH_DB)
+        if need_search_build:
+            search_index_module.rebuild(search_index, store, UPLOAD_FOLDER)
+
+    dir_tree = DirTree(UPLOAD_FOLDER, DIR_TREE_CHECK_INTERVAL)
+    markdown_pipeline = MarkdownPipeline(MARKDOWN_EXTENSIONS.split(','), MARKDOWN_CODE_STYLE)
+    render_cache = RenderCache(markdown_pipeline, RENDER_CACHE_BYTES, RENDER_CACHE_DIR or None)
+    chunked_uploads = ChunkedUploads(UPLOAD_TMP_FOLDER, MAX_CONCURRENT_UPLOADS, MAX_CHUNK_BYTES)
+    job_queue = JobQueue(JOBS_DB, JOB_WORKERS, JOB_RETENTION_DAYS * 86400)
+    register_job_handlers()
+    blob_store = BlobStore(BLOB_FOLDER)
+    version_history = VersionHistory(HISTORY_DB, HISTORY_KEYFRAME_INTERVAL, HISTORY_MAX_REVISIONS,
+                                     HISTORY_MAX_AGE_DAYS * 86400)
+    os.makedirs(NOTE_LOCK_FOLDER, exist_ok=True)
+    note_locks = [FileLock(os.path.join(NOTE_LOCK_FOLDER, f'{i:02x}.lock')) for i in range(NOTE_LOCK_STRIPES)]
+    if PROFILE_SLOW_MS > 0:
+        profiler = metrics.SlowRequestProfiler(PROFILE_SLOW_MS / 1000, PROFILE_INTERVAL_MS / 1000, PROFILE_FOLDER)
+    metrics.REGISTRY.add_collector(collect_metrics)
+    # 最后赋值: create_app() 不加锁的快速路径只在各部分都建好之后才放行 (预热不影响正确性)
+    metadata_store = store
+    if not LAZY_START:
+        warm_state()
+
+def note_lock(key):
+    return note_locks[zlib.crc32(key.encode('utf-8')) % len(note_locks)]
+
+def warm_state():
+    # 每个进程启动时调用一次；之后各部分按自己的方式保持同步:
+    # 元数据 (json 后端按文件 stat 重新解析)、目录树 (目录 mtime)、模板 (Jinja 按文件 mtime 自动重载，仅调试模式)
+    metadata_store.warm()
+    dir_tree.children('')
+    for name in PRELOAD_TEMPLATES:
+        app.jinja_env.get_template(name)
+    markdown_pipeline.warm()
+    search_index_module.warm()
+
+def collect_metrics():
+    return [
+        ('render_cache_hits_total', {}, render_cache.hits),
+        ('render_cache_misses_total', {}, render_cache.misses),
+        ('code_highlight_cache_hits_total', {}, markdown_pipeline.code_cache.hits),
+        ('code_highlight_cache_misses_total', {}, markdown_pipeline.code_cache.misses),
+        ('preview_block_cache_hits_total', {}, markdown_pipeline.block_cache.hits),
+        ('preview_block_cache_misses_total', {}, markdown_pipeline.block_cache.misses),
+        ('metadata_bytes_parsed_total', {'backend': METADATA_BACKEND}, metadata_store.bytes_parsed),
+    ]
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.phases = metrics.begin_request()
+    if profiler is not None:
+        profiler.begin()
+
+@app.after_request
+def record_request_timing(response):
+    # 只统计到视图返回为止，流式响应体的发送时间不计入
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+    metrics.REGISTRY.observe('request_duration_seconds', elapsed,
+                             endpoint=endpoint, method=request.method, status=response.status_code)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing(g.phases, elapsed)
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    metrics.end_request()
+    if profiler is not None and 'request_start' in g:
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        path = profiler.end(time.perf_counter() - g.request_start, endpoint)
+        if path:
+            app.logger.warning("慢请求 %s %s，采样栈已写入 %s", request.method, request.path, path)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.cli.command('migrate-metadata')
+def migrate_metadata_command():
+    # 手动把 metadata.json 重新导入到 sqlite (已存在的记录会被覆盖)
+    store = SqliteMetadataStore(METADATA_DB)
+    count = migrate_json(METADATA_FILE, store)
+    migrate_to_paths(store, UPLOAD_FOLDER)
+    print(f"已迁移 {count} 条元数据记录")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    create_app()
+    updated, removed = search_index_module.rebuild(search_index, metadata_store, UPLOAD_FOLDER)
+    print(f"全文索引重建完成: 更新 {updated} 篇, 删除 {removed} 篇")
+
+@app.cli.command('dedupe-uploads')
+def dedupe_uploads_command():
+    # 把已有的 upload_folder 纳入去重存储，重复内容只保留一份
+    create_app()
+    processed, saved = dedupe_tree(blob_store, UPLOAD_FOLDER, metadata_store)
+    removed, freed = blob_store.gc()
+    print(f"去重完成: 处理 {processed} 个文件, 节省 {saved} 字节; 回收 {removed} 个无引用 blob ({freed} 字节)")
+
+@app.cli.command('gc-blobs')
+def gc_blobs_command():
+    create_app()
+    removed, freed = blob_store.gc()
+    print(f"回收 {removed} 个无引用 blob, 释放 {freed} 字节")
+
+@app.cli.command('compact-history')
+def compact_history_command():
+    # 按当前保留策略和关键帧间隔重写所有笔记的版本历史
+    create_app()
+    removed = 0
+    paths = version_history.paths()
+    for key in paths:
+        removed += version_history.compact(key)
+    print(f"版本历史压缩完成: {len(paths)} 篇笔记, 删除 {removed} 个旧版本")
+
+@app.cli.command('export-site')
+def export_site_command():
+    # 把共享笔记和目录页导出为静态 HTML (可由 nginx 直接提供)，只重新渲染有变化的页面
+    # 进程池和 jinja 环境只有导出时用到，按需导入
+    from static_export import export_site
+    create_app()
+    stats = export_site(metadata_store, UPLOAD_FOLDER, EXPORT_FOLDER, MARKDOWN_EXTENSIONS.split(','),
+                        MARKDOWN_CODE_STYLE, EXPORT_WORKERS or None)
+    print(f"静态导出完成 ({stats['seconds']:.2f}s): 笔记 {stats['notes']} 篇, 重新渲染 {stats['notes_rendered']} 篇; "
+          f"目录页 {stats['dirs']} 个, 重新渲染 {stats['dirs_rendered']} 个; 删除过期页面 {stats['removed']} 个 -> {EXPORT_FOLDER}")
+
+@app.template_filter('timestamp')
 def format_timestamp(ts):
+    if not ts:
+        return ''
     return datetime.fromtimestamp(int(ts)).strftime('%Y-%m-%d %H:%M:%S')
 
+@app.template_global()
+def row_url(endpoint, path=None):
+    # 目录列表每行都有好几个链接，逐个 url_for 要走一遍路由构建 (每次几十微秒)；
+    # 这里每个请求对每个 endpoint 只构建一次，之后直接拼接路径，转义规则与 werkzeug 的 path 转换器相同
+    cache = g.setdefault('row_urls', {})
+    if path is None:
+        url = cache.get(endpoint)
+        if url is None:
+            url = cache[endpoint] = url_for(endpoint)
+        return url
+    parts = cache.get((endpoint,))
+    if parts is None:
+        rule = next(r for r in app.url_map.iter_rules(endpoint) if r.arguments)
+        url = url_for(endpoint, **{next(iter(rule.arguments)): '\0'})
+        parts = cache[(endpoint,)] = url.partition('%00')[::2]
+    return parts[0] + quote(path, safe="!$&'()*+,/:;=@") + parts[1]
+
 def is_valid_name(name):
     # 不允许中文，仅限字母、数字、下划线、点和横杠
-    pattern = re.compile(r'^[A-Za-z0-9._-]+$')
-    return bool(pattern.match(name))
-
-def list_all_dirs():
-    # 用 '/' 表示根目录
-    dir_set = set()
-    for root, dirs, files in os.walk(UPLOAD_FOLDER):
-        rel_path = os.path.relpath(root, UPLOAD_FOLDER)
-        if rel_path == '.':
-            dir_set.add('/')
-        else:
-            d_path = rel_path.replace('\\', '/')
-            dir_set.add(d_path)
-            for d in dirs:
-                sub_path = os.path.join(d_path, d).replace('\\', '/')
-                dir_set.add(sub_path)
-    dir_list = list(dir_set)
-    dir_list.sort()
-    return dir_list
+    return bool(VALID_NAME_RE.match(name))
+
+@app.route('/api/dirs')
+def api_dirs():
+    # 移动目标下拉框按需加载某个目录的下一级子目录
+    path = make_key(request.args.get('path', ''))
+    children = dir_tree.children(path)
+    if children is None:
+        abort(404)
+    return jsonify({
+        'path': path,
+        'dirs': [{'path': rel, 'name': rel.rpartition('/')[2], 'has_children': has_children}
+                 for rel, has_children in children]
+    })
+
+@app.route('/api/list')
+def api_list():
+    # 分页的目录列表；format=html 时返回渲染好的行，供首页“加载更多”使用
+    current_dir = make_key(request.args.get('dir', ''))
+    sort_by = request.args.get('sort_by', 'name')
+    sort_order = request.args.get('order', 'asc')
+    search_keyword = request.args.get('search', '').strip()
+    cursor = request.args.get('cursor', '') or None
+    limit = min(max(request.args.get('limit', LIST_PAGE_SIZE, type=int), 1), 1000)
+
+    browse_path = os.path.join(UPLOAD_FOLDER, current_dir)
+    if not os.path.isdir(browse_path):
+        abort(404)
+    with metrics.phase('metadata'):
+        records = metadata_store.list_dir(current_dir)
+    with metrics.phase('scan'):
+        all_folders, all_files = scan_directory(browse_path, records, search_keyword)
+    try:
+        with metrics.phase('paginate'):
+            folders, files, next_cursor = paginate(all_folders, all_files, sort_by, sort_order, cursor, limit)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('format') == 'html':
+        folder_row = get_template_attribute('_rows.html', 'folder_row')
+        file_row = get_template_attribute('_rows.html', 'file_row')
+        return jsonify({
+            'folders_html': ''.join(folder_row(folder, current_dir) for folder in folders),
+            'files_html': ''.join(file_row(f, current_dir) for f in files),
+            'next_cursor': next_cursor
+        })
+    items = [{'type': 'dir', 'name': folder, 'path': make_key(current_dir, folder)} for folder in folders]
+    items += [dict(f, type='file', path=make_key(current_dir, f['name'])) for f in files]
+    return jsonify({
+        'dir': current_dir,
+        'sort_by': sort_by,
+        'order': sort_order,
+        'items': items,
+        'next_cursor': next_cursor
+    })
+
+@app.route('/search')
+def search():
+    # 全文搜索整棵目录树，按相关度排序并分页
+    keyword = request.args.get('q', '').strip()
+    auth_user = request.args.get('auth_user', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    with metrics.phase('search'):
+        total, results = search_index.search(keyword, auth_user, page, per_page)
+    return jsonify({
+        'query': keyword,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'results': results
+    })
 
 @app.route('/')
 def index():
@@ -64,55 +361,19 @@ def index():
     search_keyword = request.args.get('search', '').strip()
     selected = request.args.get('selected', '')
     auth_user = request.args.get('auth_user', '').strip()
+    job_id = request.args.get('job', '')
 
     browse_path = os.path.join(UPLOAD_FOLDER, current_dir)
     if not os.path.exists(browse_path):
         browse_path = UPLOAD_FOLDER
         current_dir = ''
 
-    metadata = load_metadata()
-    items = os.listdir(browse_path)
-
-    folders = []
-    files = []
-    for item in items:
-        full_path = os.path.join(browse_path, item)
-        if os.path.isdir(full_path):
-            if search_keyword:
-                if search_keyword.lower() not in item.lower():
-                    continue
-            folders.append(item)
-        else:
-            if item.lower().endswith('.md'):
-                file_meta = metadata.get(item, {})
-                original_name = file_meta.get('original_name', item)
-                upload_time = file_meta.get('upload_time', '')
-                edit_time = file_meta.get('edit_time', '')
-                owner = file_meta.get('owner', 'shared')
-                if search_keyword:
-                    if search_keyword.lower() not in original_name.lower():
-                        continue
-                formatted_upload_time = format_timestamp(upload_time) if upload_time else ''
-                formatted_edit_time = format_timestamp(edit_time) if edit_time else ''
-                files.append({
-                    'name': item,
-                    'original_name': original_name,
-                    'upload_time': formatted_upload_time,
-                    'edit_time': formatted_edit_time,
-                    'owner': owner
-                })
-
-    def sort_key(f):
-        if sort_by == 'name':
-            return f['original_name'].lower()
-        elif sort_by == 'upload_time':
-            return f['upload_time']
-        elif sort_by == 'edit_time':
-            return f['edit_time']
-        else:
-            return f['original_name'].lower()
-
-    files = sorted(files, key=sort_key, reverse=(sort_order == 'desc'))
+    with metrics.phase('metadata'):
+        records = metadata_store.list_dir(make_key(current_dir))
+    with metrics.phase('scan'):
+        all_folders, all_files = scan_directory(browse_path, records, search_keyword)
+    with metrics.phase('paginate'):
+        folders, files, next_cursor = paginate(all_folders, all_files, sort_by, sort_order, limit=LIST_PAGE_SIZE)
 
     parent_dir = ''
     if current_dir:
@@ -124,47 +385,55 @@ def index():
     selected_file_original_name = ''
     need_auth_to_view = False
     selected_file_html = ''
+    selected_file_etag = ''
     is_new_file = (selected == '__new__')
 
     if selected and not is_new_file:
-        selected_file_info = next((f for f in files if f['name'] == selected), None)
+        selected_file_info = next((f for f in all_files if f['name'] == selected), None)
         if selected_file_info:
             selected_full_path = os.path.join(browse_path, selected)
             selected_file_owner = selected_file_info['owner']
             selected_file_original_name = selected_file_info['original_name']
 
+            selected_key = make_key(current_dir, selected)
+
             if selected_file_owner != 'shared':
                 if auth_user == selected_file_owner:
                     if os.path.exists(selected_full_path):
-                        with open(selected_full_path, 'r', encoding='utf-8') as f:
-                            selected_file_content = f.read()
-                        selected_file_html = markdown.markdown(selected_file_content)
+                        selected_file_etag = file_validators(selected_full_path)[0]
+                        with metrics.phase('render'):
+                            selected_file_content, selected_file_html = render_cache.render_file(selected_key, selected_full_path)
                 else:
                     need_auth_to_view = True
             else:
                 if os.path.exists(selected_full_path):
-                    with open(selected_full_path, 'r', encoding='utf-8') as f:
-                        selected_file_content = f.read()
-                    selected_file_html = markdown.markdown(selected_file_content)
-
-    all_dirs = list_all_dirs()
-
-    return render_template('index.html',
-                           current_dir=current_dir,
-                           parent_dir=parent_dir,
-                           folders=folders,
-                           files=files,
-                           sort_by=sort_by,
-                           sort_order=sort_order,
-                           search_keyword=search_keyword,
-                           selected_file=selected,
-                           selected_file_content=selected_file_content,
-                           selected_file_owner=selected_file_owner,
-                           selected_file_original_name=selected_file_original_name,
-                           need_auth_to_view=need_auth_to_view,
-                           selected_file_html=selected_file_html,
-                           all_dirs=all_dirs,
-                           is_new_file=is_new_file)
+                    selected_file_etag = file_validators(selected_full_path)[0]
+                    with metrics.phase('render'):
+                        selected_file_content, selected_file_html = render_cache.render_file(selected_key, selected_full_path)
+
+    with metrics.phase('dirs'):
+        top_dirs = dir_tree.children('') or []
+
+    with metrics.phase('template'):
+        return render_template('index.html',
+                               current_dir=current_dir,
+                               parent_dir=parent_dir,
+                               folders=folders,
+                               files=files,
+                               next_cursor=next_cursor,
+                               sort_by=sort_by,
+                               sort_order=sort_order,
+                               search_keyword=search_keyword,
+                               selected_file=selected,
+                               selected_file_content=selected_file_content,
+                               selected_file_owner=selected_file_owner,
+                               selected_file_original_name=selected_file_original_name,
+                               need_auth_to_view=need_auth_to_view,
+                               selected_file_html=selected_file_html,
+                               selected_file_etag=selected_file_etag,
+                               top_dirs=top_dirs,
+                               is_new_file=is_new_file,
+                               job_id=job_id)
 
 @app.route('/create_new_file', methods=['POST'])
 def create_new_file():
@@ -183,22 +452,22 @@ def create_new_file():
 
     browse_path = os.path.join(UPLOAD_FOLDER, current_dir)
     file_path = os.path.join(browse_path, new_name)
-    if os.path.exists(file_path):
-        flash("已存在同名文件，无法新建")
-        return redirect(url_for('index', dir=current_dir, selected='__new__'))
-
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+    with note_lock(make_key(current_dir, new_name)):
+        if os.path.exists(file_path):
+            flash("已存在同名文件，无法新建")
+            return redirect(url_for('index', dir=current_dir, selected='__new__'))
+        digest = blob_store.save_text(content, file_path)
 
     ts = str(int(time.time()))
-    metadata = load_metadata()
-    metadata[new_name] = {
+    owner = owner_user if owner_type == 'personal' and owner_user else 'shared'
+    metadata_store.put(make_key(current_dir, new_name), {
         "original_name": new_name,
         "upload_time": ts,
         "edit_time": ts,
-        "owner": owner_user if owner_type == 'personal' and owner_user else 'shared'
-    }
-    save_metadata(metadata)
+        "owner": owner,
+        "blob": digest
+    })
+    search_index.index_note(make_key(current_dir, new_name), new_name, owner, content)
 
     flash("新建文件成功")
     return redirect(url_for('index', dir=current_dir, selected=new_name))
@@ -217,36 +486,217 @@ def upload_file():
     owner_type = request.form.get('owner_type', 'shared')
     owner_user = request.form.get('owner_user', '').strip()
 
-    metadata = load_metadata()
-
+    # 先落盘全部文件，事务只包住元数据写入: 接收请求体期间不持有数据库写锁 / 元数据文件锁
+    owner = owner_user if owner_type == 'personal' and owner_user else 'shared'
+    uploads = []
     for file in files:
         if file:
             original_name = file.filename
             ts = str(int(time.time()))
             new_filename = f"{ts}_{original_name}"
             save_path = os.path.join(browse_path, new_filename)
-            file.save(save_path)
+            # 边接收边计算哈希，内容已存在时只建链接
+            digest = blob_store.save_stream(file.stream, save_path)
+            uploads.append((new_filename, original_name, owner, ts, digest))
+    record_uploads(current_dir, uploads)
+
+    return redirect(url_for('index', dir=current_dir))
 
-            metadata[new_filename] = {
+def record_uploads(current_dir, uploads):
+    # 已落盘的上传文件写入元数据 (一个事务) 和全文索引
+    # uploads: [(文件名, 原始文件名, 所有者, 时间戳, blob digest)]
+    with metadata_store.transaction():
+        for new_filename, original_name, owner, ts, digest in uploads:
+            metadata_store.put(make_key(current_dir, new_filename), {
                 "original_name": original_name,
                 "upload_time": ts,
                 "edit_time": ts,
-                "owner": owner_user if owner_type == 'personal' and owner_user else 'shared'
-            }
-
-    save_metadata(metadata)
-    return redirect(url_for('index', dir=current_dir))
+                "owner": owner,
+                "blob": digest
+            })
+    for new_filename, original_name, owner, ts, digest in uploads:
+        if new_filename.lower().endswith('.md'):
+            key = make_key(current_dir, new_filename)
+            search_index.index_file(key, os.path.join(UPLOAD_FOLDER, key), original_name, owner)
+
+def upload_error_response(e):
+    body = {'error': e.message}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    response = jsonify(body)
+    response.status_code = e.status
+    if e.status == 429:
+        response.headers['Retry-After'] = '1'
+    return response
+
+@app.route('/upload/init', methods=['POST'])
+def upload_init():
+    # 分块上传: 创建会话，返回 upload_id
+    current_dir = request.form.get('dir', '')
+    original_name = os.path.basename(request.form.get('filename', '').replace('\\', '/'))
+    owner_type = request.form.get('owner_type', 'shared')
+    owner_user = request.form.get('owner_user', '').strip()
+    size = request.form.get('size', None, type=int)
+
+    if not original_name:
+        return jsonify({'error': "缺少文件名"}), 400
+    if not os.path.isdir(os.path.join(UPLOAD_FOLDER, current_dir)):
+        return jsonify({'error': "目标目录不存在"}), 400
+
+    owner = owner_user if owner_type == 'personal' and owner_user else 'shared'
+    upload_id, state = chunked_uploads.init(make_key(current_dir), original_name, owner, size)
+    return jsonify({'upload_id': upload_id, 'offset': 0, 'max_chunk_bytes': MAX_CHUNK_BYTES})
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    # 查询已确认的 offset，断线后从这里继续
+    try:
+        state = chunked_uploads.status(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'upload_id': upload_id, 'offset': state['offset'], 'size': state['size']})
+
+@app.route('/upload/<upload_id>/append', methods=['PUT', 'POST'])
+def upload_append(upload_id):
+    # 请求体为原始分块数据，直接流式写入临时文件
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': "缺少 offset"}), 400
+    checksum = request.headers.get('X-Chunk-SHA256', '').strip() or None
+    try:
+        state = chunked_uploads.append(upload_id, offset, request.stream, checksum)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'upload_id': upload_id, 'offset': state['offset']})
+
+@app.route('/upload/<upload_id>/commit', methods=['POST'])
+def upload_commit(upload_id):
+    try:
+        state = chunked_uploads.status(upload_id)
+        ts = str(int(time.time()))
+        new_filename = f"{ts}_{state['filename']}"
+        dest_path = os.path.join(UPLOAD_FOLDER, state['dir'], new_filename)
+        state = chunked_uploads.commit(upload_id, dest_path)
+    except UploadError as e:
+        return upload_error_response(e)
+    digest = blob_store.adopt(dest_path)
+    record_uploads(state['dir'], [(new_filename, state['filename'], state['owner'], ts, digest)])
+    return jsonify({'path': make_key(state['dir'], new_filename), 'size': state['offset']})
+
+@app.route('/upload/<upload_id>', methods=['DELETE'])
+def upload_abort(upload_id):
+    try:
+        chunked_uploads.abort(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'upload_id': upload_id})
 
 @app.route('/download/<path:filepath>')
 def download_file(filepath):
     full_path = os.path.join(UPLOAD_FOLDER, filepath)
-    if os.path.exists(full_path):
+    if os.path.isfile(full_path):
+        file_meta = metadata_store.get(make_key(filepath), {})
+        owner = file_meta.get('owner', 'shared')
+        etag, last_modified = file_validators(full_path, edit_time=file_meta.get('edit_time'))
         # 修正：使用 download_name 指定文件名，否则部分旧方式会报错
-        return send_file(full_path, as_attachment=True, download_name=os.path.basename(full_path))
+        # conditional=True: 处理 If-None-Match / If-Modified-Since 和 Range 请求
+        response = send_file(full_path, as_attachment=True, download_name=os.path.basename(full_path),
+                             conditional=True, etag=etag, last_modified=last_modified)
+        return apply_cache_policy(response, owner)
     else:
         flash("文件不存在")
         return redirect(url_for('index'))
 
+def note_owner_or_abort(filepath):
+    # 笔记不存在返回 404；个人笔记需要 auth_user 与所有者一致
+    full_path = os.path.join(UPLOAD_FOLDER, filepath)
+    if not os.path.isfile(full_path) or not filepath.lower().endswith('.md'):
+        abort(404)
+    file_meta = metadata_store.get(make_key(filepath), {})
+    owner = file_meta.get('owner', 'shared')
+    if owner != 'shared' and request.args.get('auth_user', '').strip() != owner:
+        abort(403)
+    return full_path, owner, file_meta.get('edit_time')
+
+@app.route('/raw/<path:filepath>')
+def raw_note(filepath):
+    full_path, owner, edit_time = note_owner_or_abort(filepath)
+    etag, last_modified = file_validators(full_path, edit_time=edit_time)
+    response = send_file(full_path, mimetype='text/markdown', conditional=True,
+                         etag=etag, last_modified=last_modified)
+    return apply_cache_policy(response, owner)
+
+@app.route('/note/<path:filepath>')
+def note_fragment(filepath):
+    # 渲染后的笔记 HTML 片段；验证器有效时只需一次 stat 就返回 304
+    full_path, owner, edit_time = note_owner_or_abort(filepath)
+    # 渲染配置变化后旧的 HTML 不能再算命中
+    etag, last_modified = file_validators(full_path, variant=f'html-{markdown_pipeline.signature}-',
+                                          edit_time=edit_time)
+    cached = not_modified(etag, last_modified, owner)
+    if cached is not None:
+        return cached
+    with metrics.phase('render'):
+        content, html = render_cache.render_file(make_key(filepath), full_path)
+    response = Response(html, mimetype='text/html')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return apply_cache_policy(response, owner)
+
+@app.route('/preview', methods=['POST'])
+def preview():
+    # 编辑时的实时预览: 请求体 {"text": 全文, "known": [前端已有的块 id]}
+    # 只渲染没见过的块，前端已有的块只返回 id，由前端按顺序拼回
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    text = data.get('text')
+    if not isinstance(text, str):
+        return jsonify({'error': '缺少 text'}), 400
+    known = data.get('known') or []
+    if not isinstance(known, list) or not all(isinstance(block_id, str) for block_id in known):
+        return jsonify({'error': 'known 必须是字符串列表'}), 400
+    with metrics.phase('preview'):
+        blocks = markdown_pipeline.render_blocks(text, set(known))
+    return jsonify({'blocks': blocks})
+
+@app.route('/highlight.css')
+def highlight_css():
+    response = Response(markdown_pipeline.css(), mimetype='text/css')
+    response.set_etag(markdown_pipeline.signature)
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response.make_conditional(request)
+
+@app.route('/history/<path:filepath>')
+def note_history(filepath):
+    # 版本列表 (只读元信息)；带 ?rev=N 时返回该版本的原文
+    full_path, owner, _ = note_owner_or_abort(filepath)
+    key = make_key(filepath)
+    rev = request.args.get('rev', type=int)
+    if rev is None:
+        return jsonify({'path': key, 'revisions': version_history.revisions(key)})
+    content = version_history.get(key, rev)
+    if content is None:
+        abort(404)
+    response = Response(content, mimetype='text/markdown')
+    return apply_cache_policy(response, owner)
+
+@app.route('/diff/<path:filepath>')
+def note_diff(filepath):
+    # 两个版本之间的 unified diff，默认为最新版本与上一版本
+    full_path, owner, _ = note_owner_or_abort(filepath)
+    key = make_key(filepath)
+    to_rev = request.args.get('to', type=int)
+    if to_rev is None:
+        to_rev = version_history.latest_rev(key) or 0
+    from_rev = request.args.get('from', to_rev - 1, type=int)
+    diff = version_history.diff(key, from_rev, to_rev)
+    if diff is None:
+        abort(404)
+    response = Response(diff, mimetype='text/plain')
+    return apply_cache_policy(response, owner)
+
 @app.route('/download_selected', methods=['POST'])
 def download_selected():
     selected_files = request.form.getlist('selected_files')
@@ -256,15 +706,36 @@ def download_selected():
         flash("未选择任何文件进行下载。")
         return redirect(url_for('index', dir=dir_path))
 
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for file in selected_files:
-            file_path = os.path.join(UPLOAD_FOLDER, dir_path, file)
-            if os.path.isfile(file_path) and file.lower().endswith('.md'):
-                zf.write(file_path, arcname=file)
-    memory_file.seek(0)
-    # 修正：使用 download_name
-    return send_file(memory_file, as_attachment=True, download_name='selected_files.zip')
+    # 选中的文件夹递归打包；边压缩边发送，不在内存里拼出整个压缩包
+    entries = iter_entries(os.path.join(UPLOAD_FOLDER, dir_path), selected_files, md_only=True)
+    return zip_response(entries, 'selected_files.zip')
+
+@app.route('/download_folder/', defaults={'dirpath': ''})
+@app.route('/download_folder/<path:dirpath>')
+def download_folder(dirpath):
+    full_path = os.path.join(UPLOAD_FOLDER, dirpath)
+    if not os.path.isdir(full_path):
+        flash("文件夹不存在")
+        return redirect(url_for('index'))
+    parent, _, name = make_key(dirpath).rpartition('/')
+    if not name:
+        # 整个根目录
+        entries = iter_entries(UPLOAD_FOLDER, sorted(os.listdir(UPLOAD_FOLDER)))
+        return zip_response(entries, 'all_files.zip')
+    entries = iter_entries(os.path.join(UPLOAD_FOLDER, parent), [name])
+    return zip_response(entries, f"{name}.zip")
+
+def zip_response(entries, download_name):
+    response = Response(stream_with_context(stream_zip(entries)), mimetype='application/zip')
+    # 与 send_file 相同: 非 ASCII 文件名 (如中文文件夹名) 按 RFC 5987 写到 filename*，filename 为 ASCII 兜底
+    try:
+        download_name.encode('ascii')
+        names = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': "UTF-8''" + quote(download_name, safe="!#$&+-.^_`|~")}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+    return response
 
 @app.route('/delete_selected', methods=['POST'])
 def delete_selected():
@@ -276,32 +747,67 @@ def delete_selected():
         flash("未选择任何文件或文件夹进行删除。")
         return redirect(url_for('index', dir=dir_path))
 
-    metadata = load_metadata()
-    for name in selected_files:
-        target_path = os.path.join(UPLOAD_FOLDER, dir_path, name)
-        if os.path.isdir(target_path):
-            if os.path.exists(target_path):
-                shutil.rmtree(target_path)
-                flash(f"文件夹 '{name}' 已删除。")
-            else:
-                flash(f"文件夹 '{name}' 不存在或无法删除。")
-        else:
-            file_meta = metadata.get(name, {})
-            file_owner = file_meta.get('owner', 'shared')
-            if file_owner != 'shared' and owner_user != file_owner:
-                flash(f"文件 '{file_meta.get('original_name', name)}' 的用户名不匹配，无法删除。")
-                continue
-            if os.path.exists(target_path) and os.path.isfile(target_path):
-                os.remove(target_path)
-                if name in metadata:
-                    del metadata[name]
-                flash(f"文件 '{file_meta.get('original_name', name)}' 已删除。")
-            else:
-                flash(f"文件 '{file_meta.get('original_name', name)}' 不存在或无法删除。")
+    if needs_background_job(dir_path, selected_files):
+        job_id = job_queue.submit('delete', {
+            'dir': dir_path,
+            'owner_user': owner_user,
+            'items': describe_items(dir_path, selected_files)
+        })
+        flash(f"已提交后台删除任务，共 {len(selected_files)} 项。")
+        return redirect(url_for('index', dir=dir_path, job=job_id))
+
+    with metadata_store.transaction():
+        for name in selected_files:
+            flash(delete_entry(dir_path, name, owner_user))
 
-    save_metadata(metadata)
     return redirect(url_for('index', dir=dir_path))
 
+def delete_entry(dir_path, name, owner_user, item_type=None):
+    # 删除单个文件/文件夹并清理元数据、缓存和索引，返回提示消息；重复执行是安全的
+    target_path = os.path.join(UPLOAD_FOLDER, dir_path, name)
+    key = make_key(dir_path, name)
+    if item_type is None:
+        item_type = 'dir' if os.path.isdir(target_path) else 'file'
+
+    if item_type == 'dir':
+        existed = os.path.isdir(target_path)
+        blobs = subtree_blobs(key)
+        if existed:
+            shutil.rmtree(target_path)
+        # 即使文件夹已不存在也清理一遍，续跑被中断的任务时补齐元数据
+        metadata_store.delete_prefix(key)
+        release_blobs(blobs)
+        dir_tree.remove(key)
+        render_cache.invalidate_prefix(key)
+        search_index.remove_prefix(key)
+        version_history.remove_prefix(key)
+        return f"文件夹 '{name}' 已删除。" if existed else f"文件夹 '{name}' 不存在或无法删除。"
+
+    file_meta = metadata_store.get(key, {})
+    file_owner = file_meta.get('owner', 'shared')
+    if file_owner != 'shared' and owner_user != file_owner:
+        return f"文件 '{file_meta.get('original_name', name)}' 的用户名不匹配，无法删除。"
+    existed = os.path.isfile(target_path)
+    if existed:
+        os.remove(target_path)
+    # 即使文件已不存在也清理一遍，续跑在删除文件之后被中断的任务时补齐元数据、blob 和索引
+    metadata_store.delete(key)
+    blob_store.release(file_meta.get('blob'))
+    render_cache.invalidate(key)
+    search_index.remove(key)
+    version_history.remove(key)
+    if existed:
+        return f"文件 '{file_meta.get('original_name', name)}' 已删除。"
+    return f"文件 '{file_meta.get('original_name', name)}' 不存在或无法删除。"
+
+def subtree_blobs(key):
+    # 删除文件夹前从元数据收集子树引用的 blob，删除后逐个释放；全量扫描 (gc) 只留给命令行
+    return {record['blob'] for _, record in metadata_store.list_prefix(key) if record.get('blob')}
+
+def release_blobs(digests):
+    for digest in digests:
+        blob_store.release(digest)
+
 @app.route('/move_selected', methods=['POST'])
 def move_selected():
     selected_files = request.form.getlist('selected_files')
@@ -316,85 +822,274 @@ def move_selected():
         flash("未选择目标目录。")
         return redirect(url_for('index', dir=current_dir))
 
-    metadata = load_metadata()
-    for name in selected_files:
-        source_path = os.path.join(UPLOAD_FOLDER, current_dir, name)
-        if target_dir == '/':
-            dest_path = os.path.join(UPLOAD_FOLDER, name)
-        else:
-            dest_path = os.path.join(UPLOAD_FOLDER, target_dir.strip('/'), name)
-
-        if os.path.exists(dest_path):
-            flash(f"目标位置已存在同名文件或文件夹 '{name}'，无法移动。")
-            continue
+    if needs_background_job(current_dir, selected_files):
+        job_id = job_queue.submit('move', {
+            'dir': current_dir,
+            'target_dir': target_dir,
+            'items': describe_items(current_dir, selected_files)
+        })
+        flash(f"已提交后台移动任务，共 {len(selected_files)} 项。")
+        return redirect(url_for('index', dir=current_dir, job=job_id))
 
-        if os.path.isdir(source_path):
-            shutil.move(source_path, dest_path)
-            flash(f"文件夹 '{name}' 已移动到 '{'根目录' if target_dir == '/' else target_dir}'。")
-        else:
-            if name not in metadata:
-                flash(f"元数据中未找到文件 '{name}'，无法移动。")
-                continue
-            file_owner = metadata[name].get('owner', 'shared')
-            if file_owner != 'shared':
-                flash(f"文件 '{metadata[name].get('original_name', name)}' 是个人文件，无法批量移动。")
-                continue
-            if os.path.exists(source_path) and os.path.isfile(source_path):
-                shutil.move(source_path, dest_path)
-                metadata[name]['upload_time'] = str(int(time.time()))
-                metadata[name]['edit_time'] = str(int(time.time()))
-                flash(f"文件 '{metadata[name].get('original_name', name)}' 已移动到 '{'根目录' if target_dir == '/' else target_dir}'。")
-            else:
-                flash(f"文件 '{metadata[name].get('original_name', name)}' 不存在或无法移动。")
+    with metadata_store.transaction():
+        for name in selected_files:
+            flash(move_entry(current_dir, name, target_dir))
 
-    save_metadata(metadata)
     return redirect(url_for('index', dir=current_dir))
 
+def move_entry(current_dir, name, target_dir, job=None):
+    # 移动单个文件/文件夹，返回提示消息
+    # 后台任务在移动文件前记下检查点 (moving = 当前条目序号)；续跑时检查点对得上、源已不存在而目标存在，
+    # 才视为上次移动在改元数据前被中断，只补做元数据部分。其余情况 (重复提交等) 源不存在就报错
+    source_path = os.path.join(UPLOAD_FOLDER, current_dir, name)
+    if target_dir == '/':
+        dest_path = os.path.join(UPLOAD_FOLDER, name)
+    else:
+        dest_path = os.path.join(UPLOAD_FOLDER, target_dir.strip('/'), name)
+    source_key = make_key(current_dir, name)
+    dest_key = make_key(target_dir, name)
+    target_label = '根目录' if target_dir == '/' else target_dir
+    resuming = (job is not None and job.state.get('moving') == job.done
+                and not os.path.exists(source_path) and os.path.exists(dest_path))
+
+    if not resuming and not os.path.exists(source_path):
+        return f"'{name}' 不存在，无法移动。"
+    if os.path.exists(dest_path) and not resuming:
+        return f"目标位置已存在同名文件或文件夹 '{name}'，无法移动。"
+
+    if os.path.isdir(source_path) or (resuming and os.path.isdir(dest_path)):
+        if not resuming:
+            mark_moving(job)
+            shutil.move(source_path, dest_path)
+        metadata_store.move_prefix(source_key, dest_key)
+        dir_tree.move(source_key, dest_key)
+        render_cache.invalidate_prefix(source_key)
+        search_index.move_prefix(source_key, dest_key)
+        version_history.move_prefix(source_key, dest_key)
+        return f"文件夹 '{name}' 已移动到 '{target_label}'。"
+
+    file_meta = metadata_store.get(source_key)
+    if file_meta is None and resuming and metadata_store.get(dest_key) is not None:
+        # 元数据已经改好，中断在索引 / 历史之前
+        render_cache.invalidate(source_key)
+        search_index.move(source_key, dest_key)
+        version_history.move(source_key, dest_key)
+        return f"文件 '{name}' 已移动到 '{target_label}'。"
+    if file_meta is None:
+        return f"元数据中未找到文件 '{name}'，无法移动。"
+    file_owner = file_meta.get('owner', 'shared')
+    if file_owner != 'shared':
+        return f"文件 '{file_meta.get('original_name', name)}' 是个人文件，无法批量移动。"
+    if resuming or os.path.isfile(source_path):
+        if not resuming:
+            mark_moving(job)
+            shutil.move(source_path, dest_path)
+        file_meta['upload_time'] = str(int(time.time()))
+        file_meta['edit_time'] = str(int(time.time()))
+        # 后台任务里逐项执行，没有外层事务；两条修改必须一起提交，否则中断后源记录丢失
+        with metadata_store.transaction():
+            metadata_store.put(dest_key, file_meta)
+            metadata_store.delete(source_key)
+        render_cache.invalidate(source_key)
+        search_index.move(source_key, dest_key)
+        version_history.move(source_key, dest_key)
+        return f"文件 '{file_meta.get('original_name', name)}' 已移动到 '{target_label}'。"
+    return f"文件 '{file_meta.get('original_name', name)}' 不存在或无法移动。"
+
+def mark_moving(job):
+    if job is not None:
+        job.save_state(moving=job.done)
+
+def describe_items(dir_path, names):
+    return [{'name': name, 'type': 'dir' if os.path.isdir(os.path.join(UPLOAD_FOLDER, dir_path, name)) else 'file'}
+            for name in names]
+
+def needs_background_job(dir_path, names):
+    # 含文件夹或条目较多的批量操作放到后台任务执行，避免阻塞请求线程
+    if len(names) > JOB_INLINE_LIMIT:
+        return True
+    return any(os.path.isdir(os.path.join(UPLOAD_FOLDER, dir_path, name)) for name in names)
+
+def run_delete_job(job):
+    params = job.params
+    job.for_each(params['items'],
+                 lambda item: delete_entry(params['dir'], item['name'], params['owner_user'], item['type']))
+
+def run_move_job(job):
+    params = job.params
+    job.for_each(params['items'],
+                 lambda item: move_entry(params['dir'], item['name'], params['target_dir'], job))
+
+def run_export_job(job):
+    # 打包到临时文件后原子改名；中断后重新执行会从头打包
+    params = job.params
+    entries = list(iter_entries(os.path.join(UPLOAD_FOLDER, params['dir']), params['items']))
+    out_path = os.path.join(JOB_OUTPUT_FOLDER, f"{job.id}.zip")
+    tmp_path = out_path + '.tmp'
+    job.done = 0
+    job.set_total(len(entries))
+
+    def tracked():
+        for entry in entries:
+            if job.cancelled():
+                raise JobCancelled()
+            yield entry
+            job.checkpoint()
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in stream_zip(tracked()):
+                f.write(chunk)
+        os.replace(tmp_path, out_path)
+    finally:
+        # 取消或失败时不留下打包了一半的文件
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {'download_name': params.get('download_name', 'export.zip'), 'size': os.path.getsize(out_path)}
+
+def purge_job_outputs():
+    # 导出文件按修改时间清理 (与任务记录的保留期相同)，也会清掉进程崩溃时遗留的 .tmp
+    cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+    for name in os.listdir(JOB_OUTPUT_FOLDER):
+        path = os.path.join(JOB_OUTPUT_FOLDER, name)
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def register_job_handlers():
+    job_queue.register('delete', run_delete_job)
+    job_queue.register('move', run_move_job)
+    job_queue.register('export', run_export_job)
+
+@app.before_request
+def resume_jobs():
+    # 第一个请求时续跑上次未完成的任务 (避免 debug 模式的重载父进程也去执行)
+    # 直接 flask run 没有经过 create_app() 时在这里补上初始化
+    global jobs_resumed
+    create_app()
+    if not jobs_resumed:
+        with init_lock:
+            if not jobs_resumed:
+                job_queue.resume()
+                jobs_resumed = True
+
+@app.route('/jobs/export', methods=['POST'])
+def submit_export_job():
+    selected_files = request.form.getlist('selected_files')
+    dir_path = request.form.get('dir', '')
+    if not selected_files:
+        return jsonify({'error': "未选择任何文件进行导出。"}), 400
+    purge_job_outputs()
+    job_id = job_queue.submit('export', {
+        'dir': dir_path,
+        'items': selected_files,
+        'download_name': request.form.get('download_name', 'export.zip')
+    })
+    return jsonify({'job_id': job_id}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/download')
+def download_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None or job['kind'] != 'export' or job['status'] != DONE:
+        abort(404)
+    return send_file(os.path.join(JOB_OUTPUT_FOLDER, f"{job_id}.zip"), as_attachment=True,
+                     download_name=job['result']['download_name'])
+
 @app.route('/update_file', methods=['POST'])
 def update_file():
     current_dir = request.form.get('dir', '')
     filename = request.form.get('filename', '')
     owner_user_input = request.form.get('owner_user', '').strip()
     new_content = request.form.get('content', '')
+    # 乐观并发: 客户端带上打开编辑时的 ETag (If-Match 头或 expected_etag) 或 edit_time，
+    # 文件在此期间被别人改过则拒绝保存
+    expected_etag = request.form.get('expected_etag', '').strip()
+    expected_edit_time = request.form.get('expected_edit_time', '').strip()
 
     browse_path = os.path.join(UPLOAD_FOLDER, current_dir)
     full_path = os.path.join(browse_path, filename)
+    key = make_key(current_dir, filename)
 
-    if not os.path.exists(full_path):
-        flash("文件不存在")
-        return redirect(url_for('index', dir=current_dir))
-
-    metadata = load_metadata()
-    file_meta = metadata.get(filename, {})
-    file_owner = file_meta.get('owner', 'shared')
-
-    if file_owner != 'shared':
-        if owner_user_input != file_owner:
-            flash("用户名不匹配，无权编辑此文件")
-            return redirect(url_for('index', dir=current_dir, selected=filename))
+    with note_lock(key):
+        if not os.path.exists(full_path):
+            flash("文件不存在")
+            return redirect(url_for('index', dir=current_dir))
 
-    with open(full_path, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+        file_meta = metadata_store.get(key, {})
+        file_owner = file_meta.get('owner', 'shared')
+        auth_user = owner_user_input if file_owner != 'shared' else ''
+
+        if file_owner != 'shared':
+            if owner_user_input != file_owner:
+                flash("用户名不匹配，无权编辑此文件")
+                return redirect(url_for('index', dir=current_dir, selected=filename))
+
+        etag, _ = file_validators(full_path)
+        if request.if_match and not request.if_match.contains(etag):
+            return jsonify({'error': "文件已被修改", 'etag': etag}), 412
+        if (expected_etag and expected_etag != etag) or \
+                (expected_edit_time and expected_edit_time != str(file_meta.get('edit_time', ''))):
+            flash("保存失败: 文件在你编辑期间已被其他人修改，请刷新后重新编辑")
+            return redirect(url_for('index', dir=current_dir, selected=filename, auth_user=auth_user))
+
+        if not version_history.exists(key):
+            # 第一次编辑时先把原始内容存为第一个版本
+            with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+                version_history.record(key, f.read(), auth_user,
+                                       int(file_meta.get('edit_time') or file_meta.get('upload_time') or time.time()))
+
+        # 写新 blob 后原子替换链接，不会改到共享同一内容的其他笔记
+        old_digest = file_meta.get('blob')
+        file_meta['blob'] = blob_store.save_text(new_content, full_path)
+        file_meta['edit_time'] = str(int(time.time()))
+        metadata_store.put(key, file_meta)
+        if old_digest != file_meta['blob']:
+            blob_store.release(old_digest)
+        version_history.record(key, new_content, auth_user, int(file_meta['edit_time']))
+        etag, _ = file_validators(full_path)
 
-    file_meta['edit_time'] = str(int(time.time()))
-    metadata[filename] = file_meta
-    save_metadata(metadata)
+    render_cache.invalidate(key)
+    search_index.index_note(key, file_meta.get('original_name', filename), file_owner, new_content)
 
     flash("文件已保存")
-    return redirect(url_for('index', dir=current_dir, selected=filename, auth_user=owner_user_input if file_owner!='shared' else ''))
+    response = redirect(url_for('index', dir=current_dir, selected=filename, auth_user=auth_user))
+    response.set_etag(etag)
+    return response
 
 @app.route('/delete_item/<path:filepath>', methods=['POST'])
 def delete_item(filepath):
     full_path = os.path.join(UPLOAD_FOLDER, filepath)
     if os.path.isdir(full_path):
         if os.path.exists(full_path):
+            blobs = subtree_blobs(make_key(filepath))
             shutil.rmtree(full_path)
+            metadata_store.delete_prefix(make_key(filepath))
+            release_blobs(blobs)
+            dir_tree.remove(make_key(filepath))
+            render_cache.invalidate_prefix(make_key(filepath))
+            search_index.remove_prefix(make_key(filepath))
+            version_history.remove_prefix(make_key(filepath))
             flash(f"文件夹 '{os.path.basename(filepath)}' 已删除。")
         else:
             flash("文件夹不存在或无法删除")
     else:
-        metadata = load_metadata()
-        file_meta = metadata.get(os.path.basename(filepath), {})
+        file_meta = metadata_store.get(make_key(filepath), {})
         file_owner = file_meta.get('owner', 'shared')
         user_input_owner = request.form.get('owner_user', '').strip()
         if file_owner != 'shared' and user_input_owner != file_owner:
@@ -403,9 +1098,11 @@ def delete_item(filepath):
 
         if os.path.exists(full_path) and os.path.isfile(full_path):
             os.remove(full_path)
-            if os.path.basename(filepath) in metadata:
-                del metadata[os.path.basename(filepath)]
-                save_metadata(metadata)
+            metadata_store.delete(make_key(filepath))
+            blob_store.release(file_meta.get('blob'))
+            render_cache.invalidate(make_key(filepath))
+            search_index.remove(make_key(filepath))
+            version_history.remove(make_key(filepath))
             flash("文件已删除")
         else:
             flash("文件不存在或无法删除")
@@ -420,6 +1117,7 @@ def mkdir():
         new_path = os.path.join(UPLOAD_FOLDER, current_dir, folder_name)
         if not os.path.exists(new_path):
             os.makedirs(new_path)
+            dir_tree.add(make_key(current_dir, folder_name))
     return redirect(url_for('index', dir=current_dir))
 
 @app.route('/rename_item', methods=['POST'])
@@ -448,20 +1146,29 @@ def rename_item():
         return redirect(url_for('index', dir=current_dir))
 
     if item_type == 'file':
-        metadata = load_metadata()
-        if old_name not in metadata:
+        old_key = make_key(current_dir, old_name)
+        file_meta = metadata_store.get(old_key)
+        if file_meta is None:
             flash("元数据中未找到此文件。")
             return redirect(url_for('index', dir=current_dir))
         os.rename(old_path, new_path)
-        file_meta = metadata[old_name]
-        del metadata[old_name]
         file_meta['original_name'] = new_name
         file_meta['edit_time'] = str(int(time.time()))
-        metadata[new_name] = file_meta
-        save_metadata(metadata)
+        with metadata_store.transaction():
+            metadata_store.delete(old_key)
+            metadata_store.put(make_key(current_dir, new_name), file_meta)
+        render_cache.invalidate(old_key)
+        search_index.move(old_key, make_key(current_dir, new_name))
+        version_history.move(old_key, make_key(current_dir, new_name))
+        search_index.index_file(make_key(current_dir, new_name), new_path, new_name, file_meta.get('owner', 'shared'))
         flash("文件重命名成功。")
     elif item_type == 'folder':
         os.rename(old_path, new_path)
+        metadata_store.move_prefix(make_key(current_dir, old_name), make_key(current_dir, new_name))
+        dir_tree.move(make_key(current_dir, old_name), make_key(current_dir, new_name))
+        render_cache.invalidate_prefix(make_key(current_dir, old_name))
+        search_index.move_prefix(make_key(current_dir, old_name), make_key(current_dir, new_name))
+        version_history.move_prefix(make_key(current_dir, old_name), make_key(current_dir, new_name))
         flash("文件夹重命名成功。")
     else:
         flash("无效的重命名类型。")
@@ -469,4 +1176,5 @@ def rename_item():
     return redirect(url_for('index', dir=current_dir))
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # 开发模式；生产环境用 WSGI 服务器加载 create_app()，见 wsgi.py
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import generate
+from metadata_store import JsonMetadataStore
+from static_export import export_site
+
+# 静态导出的全量构建和增量重建耗时: 全量 -> 无变化 -> 编辑 1% 的笔记 -> 只 touch 文件 (内容不变)
+# 用法: python benchmarks/bench_export.py [文件数] [渲染进程数] [笔记KB]
+
+FILES = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+NOTE_KB = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+EXTENSIONS = ['tables', 'fenced_code', 'codehilite', 'toc']
+
+
+def report(label, stats):
+    print(f"{label:<14} {stats['seconds']:8.2f}s  笔记 {stats['notes_rendered']:>6}/{stats['notes']:<6} "
+          f"目录页 {stats['dirs_rendered']:>4}/{stats['dirs']:<4} 删除 {stats['removed']}")
+
+
+def main():
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = generate(tmp, files=FILES, depth=2, fanout=4, note_kb=NOTE_KB)
+        upload_folder = os.path.join(tmp, 'upload_folder')
+        store = JsonMetadataStore(os.path.join(tmp, 'metadata.json'))
+        out_dir = os.path.join(tmp, 'site')
+        print(f"{FILES} 篇笔记, {len(corpus['dirs'])} 个目录, {WORKERS} 个渲染进程")
+
+        report('全量构建', export_site(store, upload_folder, out_dir, EXTENSIONS, workers=WORKERS))
+        report('无变化', export_site(store, upload_folder, out_dir, EXTENSIONS, workers=WORKERS))
+
+        shared = [n for n in corpus['notes'] if n['owner'] == 'shared']
+        edited = rng.sample(shared, max(1, len(shared) // 100))
+        now = str(int(time.time()))
+        with store.transaction():
+            for note in edited:
+                key = f"{note['dir']}/{note['name']}".lstrip('/')
+                with open(os.path.join(upload_folder, key), 'a', encoding='utf-8') as f:
+                    f.write('\n追加的一段\n')
+                record = store.get(key)
+                record['edit_time'] = now
+                store.put(key, record)
+        report('编辑 1%', export_site(store, upload_folder, out_dir, EXTENSIONS, workers=WORKERS))
+
+        for note in rng.sample(shared, max(1, len(shared) // 100)):
+            os.utime(os.path.join(upload_folder, note['dir'], note['name']))
+        report('touch 1%', export_site(store, upload_folder, out_dir, EXTENSIONS, workers=WORKERS))
+
+
+if __name__ == '__main__':
+    main()
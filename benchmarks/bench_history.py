@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import VersionHistory
+
+# 一篇笔记连续编辑 N 次后的存储增长和还原耗时，对比不同关键帧间隔与每次保存全文
+# 用法: python benchmarks/bench_history.py [版本数] [笔记行数]
+
+REVISIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+LINES = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+INTERVALS = [1, 10, 50, 200]
+RESTORE_SAMPLES = 200
+
+
+def make_revisions():
+    # 每次编辑改动几行: 修改、插入或删除
+    rng = random.Random(42)
+    lines = [f"- 第 {i} 行 ns-train nerfacto --data data/poster --step {i}\n" for i in range(LINES)]
+    texts = []
+    for r in range(REVISIONS):
+        for _ in range(rng.randint(1, 4)):
+            op = rng.random()
+            pos = rng.randrange(len(lines))
+            if op < 0.6:
+                lines[pos] = f"- 修改 {r} 行 {pos} {rng.random():.6f}\n"
+            elif op < 0.85 or len(lines) < 10:
+                lines.insert(pos, f"- 插入 {r} {rng.random():.6f}\n")
+            else:
+                del lines[pos]
+        texts.append(''.join(lines))
+    return texts
+
+
+def measure(texts, interval, tmp):
+    db_path = os.path.join(tmp, f'history_{interval}.db')
+    history = VersionHistory(db_path, keyframe_interval=interval)
+    start = time.perf_counter()
+    for i, text in enumerate(texts):
+        history.record('note.md', text, ts=i)
+    record_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    stored = sum(r['stored'] for r in history.revisions('note.md'))
+    rng = random.Random(7)
+    samples = []
+    for _ in range(RESTORE_SAMPLES):
+        rev = rng.randint(1, len(texts))
+        start = time.perf_counter()
+        text = history.get('note.md', rev)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert text == texts[rev - 1]
+    samples.sort()
+    return stored, record_ms, statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    texts = make_revisions()
+    raw = sum(len(t.encode('utf-8')) for t in texts)
+    print(f"{REVISIONS} 个版本, 最终 {len(texts[-1].encode('utf-8')) // 1024} KB, 全文快照共 {raw // 1024} KB")
+    print(f"{'keyframe':>8} {'stored(KB)':>11} {'ratio':>7} {'save(ms)':>9} {'restore p50':>12} {'restore p95':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for interval in INTERVALS:
+            stored, record_ms, p50, p95 = measure(texts, interval, tmp)
+            print(f"{interval:>8} {stored // 1024:>11} {stored / raw:>7.3f} {record_ms:>9.3f} {p50:>12.3f} {p95:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
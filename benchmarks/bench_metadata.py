@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metadata_store import JsonMetadataStore, SqliteMetadataStore
+
+# 对比两种元数据后端在不同记录数下单次保存(一个请求一次事务)的耗时
+# 用法: python benchmarks/bench_metadata.py [记录数 ...]
+
+SIZES = [int(n) for n in sys.argv[1:]] or [1000, 10000, 50000]
+ROUNDS = 50
+
+
+def make_record(i):
+    ts = str(1734709761 + i)
+    return {"original_name": f"note_{i}.md", "upload_time": ts, "edit_time": ts, "owner": "shared"}
+
+
+def fill(store, size):
+    with store.transaction():
+        for i in range(size):
+            store.put(f"{1734709761 + i}_note_{i}.md", make_record(i))
+
+
+def measure(store, size):
+    samples = []
+    for r in range(ROUNDS):
+        key = f"bench_{r}.md"
+        start = time.perf_counter()
+        with store.transaction():
+            store.put(key, make_record(size + r))
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    print(f"{'backend':<8} {'records':>8} {'p50(ms)':>10} {'p95(ms)':>10}")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            stores = [
+                ('json', JsonMetadataStore(os.path.join(tmp, 'metadata.json'))),
+                ('sqlite', SqliteMetadataStore(os.path.join(tmp, 'metadata.db'))),
+            ]
+            for name, store in stores:
+                fill(store, size)
+                p50, p95 = measure(store, size)
+                store.close()
+                print(f"{name:<8} {size:>8} {p50:>10.3f} {p95:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+from urllib.parse import urlencode, quote
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import generate, WORDS
+
+# 路由基准: 在不同规模的合成语料上驱动 index / api_list / search / upload_file / download_selected / move_selected，
+# 分别用 Flask test client (单线程，测单次延迟) 和本地 HTTP 压测 (多线程，测吞吐)，
+# 报告延迟分位数、吞吐和峰值 RSS，结果写成 JSON，可以用 --compare 与之前某次提交的结果对比
+# 每个规模在独立的子进程里跑，RSS 和启动时间互不影响
+# 用法: python benchmarks/bench_routes.py --sizes 1000,10000 --output results.json [--compare old.json]
+
+
+def percentile(sorted_samples, p):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(p / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples, wall):
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) if samples else 0.0,
+        'p50_ms': percentile(samples, 50),
+        'p90_ms': percentile(samples, 90),
+        'p99_ms': percentile(samples, 99),
+        'max_ms': samples[-1] if samples else 0.0,
+        'throughput_rps': len(samples) / wall if wall else 0.0,
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def shared_notes(corpus):
+    return [n for n in corpus['notes'] if n['owner'] == 'shared']
+
+
+def build_scenarios(corpus, rng):
+    # 每个场景: (名称, func(client, i))，func 内检查状态码
+    dirs = corpus['dirs']
+    deep_dirs = [d for d in dirs if d.count('/') == max(x.count('/') for x in dirs)] or dirs
+    notes = shared_notes(corpus)
+    by_dir = {}
+    for note in corpus['notes']:
+        by_dir.setdefault(note['dir'], []).append(note['name'])
+    movable = notes[:200]
+
+    def check(response, *codes):
+        response.get_data()
+        if response.status_code not in codes:
+            raise RuntimeError(f"状态码 {response.status_code}")
+
+    def index_root(client, i):
+        check(client.get('/'), 200)
+
+    def index_dir(client, i):
+        check(client.get('/?' + urlencode({'dir': rng.choice(deep_dirs)})), 200)
+
+    def index_note(client, i):
+        note = rng.choice(notes)
+        check(client.get('/?' + urlencode({'dir': note['dir'], 'selected': note['name']})), 200)
+
+    def api_list(client, i):
+        check(client.get('/api/list?' + urlencode({'dir': rng.choice(dirs), 'sort_by': 'edit_time'})), 200)
+
+    def search(client, i):
+        check(client.get('/search?' + urlencode({'q': rng.choice(WORDS)})), 200)
+
+    def upload_file(client, i):
+        data = {'dir': rng.choice(dirs), 'file': (io.BytesIO(f"# bench {i}\n".encode() * 200), f"bench_{i}.md")}
+        check(client.post('/upload_file', data=data, content_type='multipart/form-data'), 302)
+
+    def download_selected(client, i):
+        d = rng.choice([d for d in by_dir if by_dir[d]])
+        names = by_dir[d][:10]
+        check(client.post('/download_selected', data={'dir': d, 'selected_files': names}), 200)
+
+    def move_selected(client, i):
+        # 单个共享笔记在两个目录之间来回移动，走同步路径
+        note = movable[i % len(movable)]
+        target = rng.choice([d for d in dirs if d != note['dir']])
+        check(client.post('/move_selected', data={'dir': note['dir'], 'selected_files': [note['name']],
+                                                  'target_dir': target or '/'}), 302)
+        note['dir'] = target
+
+    return [('index_root', index_root), ('index_dir', index_dir), ('index_note', index_note),
+            ('api_list', api_list), ('search', search), ('upload_file', upload_file),
+            ('download_selected', download_selected), ('move_selected', move_selected)]
+
+
+def run_test_client(app, corpus, iterations):
+    client = app.test_client()
+    rng = random.Random(3)
+    results = {}
+    for name, func in build_scenarios(corpus, rng):
+        func(client, -1)
+        samples = []
+        wall_start = time.perf_counter()
+        for i in range(iterations):
+            start = time.perf_counter()
+            func(client, i)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = summarize(samples, time.perf_counter() - wall_start)
+    return results
+
+
+def run_http(app, corpus, seconds, concurrency):
+    # 本地 HTTP 压测: 多线程 werkzeug 服务器 + concurrency 个客户端线程，混合读请求
+    from werkzeug.serving import make_server
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    notes = shared_notes(corpus)
+    dirs = corpus['dirs']
+
+    def index_note(rng):
+        note = rng.choice(notes)
+        return '/?' + urlencode({'dir': note['dir'], 'selected': note['name']})
+
+    def raw(rng):
+        note = rng.choice(notes)
+        return '/raw/' + quote(f"{note['dir']}/{note['name']}".lstrip('/'))
+
+    routes = {
+        'index_dir': lambda rng: '/?' + urlencode({'dir': rng.choice(dirs)}),
+        'index_note': index_note,
+        'api_list': lambda rng: '/api/list?' + urlencode({'dir': rng.choice(dirs)}),
+        'search': lambda rng: '/search?' + urlencode({'q': rng.choice(WORDS)}),
+        'raw': raw,
+    }
+    samples = {name: [] for name in routes}
+    errors = []
+    deadline = time.perf_counter() + seconds
+
+    def worker(seed):
+        rng = random.Random(seed)
+        names = list(routes)
+        while time.perf_counter() < deadline:
+            name = rng.choice(names)
+            path = routes[name](rng)
+            start = time.perf_counter()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(f"{name} {response.status}")
+            except OSError as e:
+                errors.append(f"{name} {e}")
+            finally:
+                conn.close()
+            samples[name].append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+    server.shutdown()
+
+    results = {name: summarize(values, wall) for name, values in samples.items() if values}
+    results['all'] = summarize([v for values in samples.values() for v in values], wall)
+    results['all']['errors'] = len(errors)
+    return results
+
+
+def run_one(config):
+    # 子进程: DATA_DIR 已指向临时目录，先生成语料再导入 app (配置在导入时读取)
+    data_dir = os.environ['DATA_DIR']
+    gen_start = time.perf_counter()
+    corpus = generate(data_dir, files=config['size'], depth=config['depth'], fanout=config['fanout'],
+                      note_kb=config['note_kb'], personal_ratio=config['personal'], seed=config['seed'])
+    generate_seconds = time.perf_counter() - gen_start
+
+    start = time.perf_counter()
+    from app import create_app
+    app = create_app()
+    startup_seconds = time.perf_counter() - start
+    app.logger.disabled = True
+
+    result = {
+        'size': config['size'],
+        'dirs': len(corpus['dirs']),
+        'generate_seconds': generate_seconds,
+        'startup_seconds': startup_seconds,
+        'test_client': run_test_client(app, corpus, config['iterations']),
+    }
+    if config['http_seconds'] > 0:
+        result['http'] = run_http(app, corpus, config['http_seconds'], config['concurrency'])
+    result['peak_rss_mb'] = peak_rss_mb()
+    print('RESULT ' + json.dumps(result, ensure_ascii=False))
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                             stderr=subprocess.DEVNULL).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_run(run):
+    rss = f"{run['peak_rss_mb']:.1f} MB" if run['peak_rss_mb'] is not None else 'n/a'
+    print(f"\n== {run['size']} 篇笔记 / {run['dirs']} 个目录: 启动 {run['startup_seconds']:.2f}s, 峰值 RSS {rss}")
+    for mode in ('test_client', 'http'):
+        if mode not in run:
+            continue
+        print(f"-- {mode}")
+        print(f"{'route':<18} {'count':>6} {'p50(ms)':>9} {'p90(ms)':>9} {'p99(ms)':>9} {'req/s':>9}")
+        for name, s in run[mode].items():
+            print(f"{name:<18} {s['count']:>6} {s['p50_ms']:>9.2f} {s['p90_ms']:>9.2f} {s['p99_ms']:>9.2f} {s['throughput_rps']:>9.1f}")
+
+
+def compare(old, new):
+    # 按 规模/模式/路由 对比 p50 和吞吐，正数表示变慢
+    old_runs = {run['size']: run for run in old['runs']}
+    print(f"\n对比 {(old.get('commit') or '?')[:10]} -> {(new.get('commit') or '?')[:10]}")
+    print(f"{'size':>7} {'mode':<12} {'route':<18} {'p50 old':>9} {'p50 new':>9} {'change':>8}")
+    for run in new['runs']:
+        base = old_runs.get(run['size'])
+        if base is None:
+            continue
+        for mode in ('test_client', 'http'):
+            for name, s in run.get(mode, {}).items():
+                b = base.get(mode, {}).get(name)
+                if not b or not b['p50_ms']:
+                    continue
+                change = (s['p50_ms'] - b['p50_ms']) / b['p50_ms'] * 100
+                print(f"{run['size']:>7} {mode:<12} {name:<18} {b['p50_ms']:>9.2f} {s['p50_ms']:>9.2f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='笔记服务路由基准')
+    parser.add_argument('--sizes', default='1000,10000', help='笔记数，逗号分隔')
+    parser.add_argument('--depth', type=int, default=2, help='目录深度')
+    parser.add_argument('--fanout', type=int, default=4, help='每层子目录数')
+    parser.add_argument('--note-kb', type=int, default=4, help='单篇笔记大小 (KB)')
+    parser.add_argument('--personal', type=float, default=0.2, help='个人笔记比例')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=50, help='test client 每个场景的请求数')
+    parser.add_argument('--http-seconds', type=float, default=5, help='HTTP 压测时长，0 表示不跑')
+    parser.add_argument('--concurrency', type=int, default=8, help='HTTP 压测并发数')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='与之前的结果文件对比')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(json.loads(args.run_one))
+        return
+
+    commit, dirty = git_commit()
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'metadata_backend': os.environ.get('METADATA_BACKEND', 'sqlite'),
+        'config': {k: v for k, v in vars(args).items() if k not in ('run_one', 'output', 'compare')},
+        'runs': [],
+    }
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        config = dict(results['config'], size=size)
+        with tempfile.TemporaryDirectory() as data_dir:
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-one', json.dumps(config)],
+                                  env=dict(os.environ, DATA_DIR=data_dir), capture_output=True, text=True)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith('RESULT ')]
+        if proc.returncode != 0 or not lines:
+            print(proc.stderr[-4000:])
+            sys.exit(f"规模 {size} 运行失败")
+        run = json.loads(lines[-1][len('RESULT '):])
+        results['runs'].append(run)
+        print_run(run)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
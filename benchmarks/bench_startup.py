@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import generate
+
+# 启动耗时与单请求开销
+# - 启动: 预热 (默认) 和 LAZY_START=1 两种模式各起 --runs 个新进程，分别计时
+#   进程总耗时 (含解释器启动)、import app、create_app() 和第一个请求 (已缓存的笔记)
+# - 单请求: 在一个预热好的进程里反复请求同一篇已缓存的笔记，报告中位数 / p95 和 Server-Timing 各阶段；
+#   同一进程里先测最便宜的 /highlight.css 作为基线，中位数超过基线的 --max-ratio 倍
+#   (或给了 --target-ms / BENCH_TARGET_MS 且超过该绝对值) 时以非 0 退出，可以放进 CI 防止回退
+# 用法: python benchmarks/bench_startup.py [--files 1000] [--runs 5] [--requests 500] [--max-ratio 15] [--target-ms 6]
+#       [--backend sqlite]
+
+
+def child(url, requests):
+    start = time.perf_counter()
+    import app
+    imported = time.perf_counter()
+    app.create_app()
+    created = time.perf_counter()
+    client = app.app.test_client()
+    if client.get(url).status_code != 200:
+        raise RuntimeError(f"{url} 请求失败")
+    first = time.perf_counter()
+    result = {'import_ms': (imported - start) * 1000, 'create_ms': (created - imported) * 1000,
+              'first_request_ms': (first - created) * 1000}
+
+    if requests:
+        # 基线: 同一进程里最便宜的请求 (已缓存的 CSS)，代表本机上 Flask 本身的单请求开销
+        baseline = []
+        for _ in range(requests):
+            t = time.perf_counter()
+            client.get('/highlight.css')
+            baseline.append((time.perf_counter() - t) * 1000)
+        app.SERVER_TIMING = True
+        samples = []
+        phases = {}
+        for _ in range(requests):
+            t = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - t) * 1000)
+            for part in response.headers['Server-Timing'].split(', '):
+                name, dur = part.split(';dur=')
+                phases.setdefault(name, []).append(float(dur))
+        samples.sort()
+        result['request'] = {'p50_ms': statistics.median(samples), 'p95_ms': samples[int(len(samples) * 0.95) - 1],
+                             'baseline_p50_ms': statistics.median(baseline),
+                             'phases': {name: statistics.median(v) for name, v in phases.items()}}
+    print(json.dumps(result))
+
+
+def run_child(data_dir, backend, url, requests=0, lazy=False):
+    env = dict(os.environ, DATA_DIR=data_dir, METADATA_BACKEND=backend, LAZY_START='1' if lazy else '0')
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', url, str(requests)],
+                          env=env, cwd=ROOT, capture_output=True, text=True)
+    wall = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process_ms'] = wall
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=500)
+    # 绝对目标与机器快慢有关，默认不检查；相对基线的倍数在不同机器上基本稳定
+    parser.add_argument('--target-ms', type=float, default=os.environ.get('BENCH_TARGET_MS'))
+    parser.add_argument('--max-ratio', type=float, default=float(os.environ.get('BENCH_MAX_RATIO', 15)))
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'json'))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        corpus = generate(data_dir, files=args.files)
+        note = next(n for n in corpus['notes'] if n['owner'] == 'shared' and n['dir'])
+        url = f"/?dir={note['dir']}&selected={note['name']}"
+        # 第一次启动会做迁移和全文索引的全量构建，不计入
+        run_child(data_dir, args.backend, url)
+
+        print(f"{args.files} 篇笔记, 后端 {args.backend}, 每种模式 {args.runs} 次 (中位数, ms)")
+        print(f"{'模式':<8} {'进程总计':>10} {'import':>10} {'create_app':>12} {'首个请求':>10}")
+        for label, lazy in (('预热', False), ('LAZY', True)):
+            runs = [run_child(data_dir, args.backend, url, lazy=lazy) for _ in range(args.runs)]
+            median = {key: statistics.median(r[key] for r in runs)
+                      for key in ('process_ms', 'import_ms', 'create_ms', 'first_request_ms')}
+            print(f"{label:<8} {median['process_ms']:>10.1f} {median['import_ms']:>10.1f} "
+                  f"{median['create_ms']:>12.1f} {median['first_request_ms']:>10.1f}")
+
+        request = run_child(data_dir, args.backend, url, requests=args.requests)['request']
+        phases = request['phases']
+        overhead = phases['total'] - sum(v for k, v in phases.items() if k != 'total')
+        ratio = request['p50_ms'] / request['baseline_p50_ms']
+        print(f"\n已缓存笔记的 index(): p50 {request['p50_ms']:.2f}ms, p95 {request['p95_ms']:.2f}ms")
+        print('  ' + ', '.join(f"{k} {v:.2f}" for k, v in phases.items()) + f"; 各阶段之外 {overhead:.2f}")
+        print(f"基线 /highlight.css: p50 {request['baseline_p50_ms']:.2f}ms, index() 是基线的 {ratio:.1f} 倍 "
+              f"(目标 <= {args.max_ratio:.1f} 倍)")
+        failed = ratio > args.max_ratio
+        if args.target_ms is not None:
+            print(f"目标 p50 <= {args.target_ms:.1f}ms")
+            failed = failed or request['p50_ms'] > args.target_ms
+        if failed:
+            print("未达到目标")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
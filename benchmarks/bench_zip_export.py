@@ -0,0 +1,76 @@
+import io
+import os
+import sys
+import time
+import zipfile
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zip_stream import iter_entries, stream_zip
+
+# 对比旧的 BytesIO 整包打包与流式打包的耗时、首字节时间和峰值内存
+# 用法: python benchmarks/bench_zip_export.py [文件数] [单个文件KB]
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+SIZE_KB = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+
+
+def make_corpus(base):
+    line = b"## nerfstudio notes\n- ns-train nerfacto --data data/poster\n"
+    for i in range(COUNT):
+        with open(os.path.join(base, f"note_{i}.md"), 'wb') as f:
+            f.write(os.urandom(SIZE_KB * 256).hex().encode()[:SIZE_KB * 512])
+            f.write(line * (SIZE_KB * 512 // len(line)))
+
+
+def bytesio_export(base, names):
+    memory_file = io.BytesIO()
+    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name in names:
+            zf.write(os.path.join(base, name), arcname=name)
+    memory_file.seek(0)
+    first = time.perf_counter()
+    total = 0
+    while True:
+        chunk = memory_file.read(64 * 1024)
+        if not chunk:
+            break
+        total += len(chunk)
+    return first, total
+
+
+def streaming_export(base, names):
+    first = None
+    total = 0
+    for chunk in stream_zip(iter_entries(base, names)):
+        if first is None and chunk:
+            first = time.perf_counter()
+        total += len(chunk)
+    return first, total
+
+
+def run(label, func, base, names):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first, total = func(base, names)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed * 1000:>10.1f} {(first - start) * 1000:>10.1f} "
+          f"{peak / 1024 / 1024:>10.2f} {total / 1024 / 1024:>10.2f}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as base:
+        make_corpus(base)
+        names = sorted(os.listdir(base))
+        print(f"{COUNT} 个文件, 每个 {SIZE_KB} KB")
+        print(f"{'mode':<10} {'total(ms)':>10} {'ttfb(ms)':>10} {'peak(MB)':>10} {'zip(MB)':>10}")
+        run('bytesio', bytesio_export, base, names)
+        run('stream', streaming_export, base, names)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metadata_store import SCHEMA_KEY, SCHEMA_VERSION
+
+# 生成合成的 upload_folder 目录树和对应的 metadata.json，供基准测试使用
+# 用法: python benchmarks/corpus.py 输出目录 [文件数] [目录深度] [每层子目录数] [笔记KB] [个人笔记比例]
+
+WORDS = ['nerfstudio', 'gaussian', 'splatting', 'colmap', 'pipeline', 'dataset', 'camera', 'render',
+         'training', 'viewer', 'checkpoint', 'export', 'mesh', 'pointcloud', 'depth', 'normal',
+         '神经', '辐射场', '训练', '渲染', '相机', '位姿', '数据集', '点云', '网格', '导出', '笔记', '实验']
+USERS = ['alice', 'bob', 'carol', 'dave']
+
+
+def make_dirs(depth, fanout):
+    # 返回所有目录的相对路径 ('' 为根目录)，按层生成
+    dirs = ['']
+    level = ['']
+    for d in range(depth):
+        level = [f"{parent}/d{d}_{i}".lstrip('/') for parent in level for i in range(fanout)]
+        dirs.extend(level)
+    return dirs
+
+
+def make_note(rng, size):
+    parts = [f"# {' '.join(rng.choice(WORDS) for _ in range(3))}\n\n"]
+    total = len(parts[0])
+    while total < size:
+        kind = rng.random()
+        if kind < 0.15:
+            block = f"## {' '.join(rng.choice(WORDS) for _ in range(2))}\n\n"
+        elif kind < 0.3:
+            block = "```bash\nns-train nerfacto --data data/" + rng.choice(WORDS) + "\n```\n\n"
+        elif kind < 0.5:
+            block = ''.join(f"- {' '.join(rng.choice(WORDS) for _ in range(6))}\n" for _ in range(4)) + '\n'
+        else:
+            block = ' '.join(rng.choice(WORDS) for _ in range(40)) + '\n\n'
+        parts.append(block)
+        total += len(block.encode('utf-8'))
+    return ''.join(parts)
+
+
+def generate(data_dir, files=1000, depth=2, fanout=4, note_kb=4, personal_ratio=0.2, seed=1, legacy=False):
+    # legacy=True 时生成旧格式的 metadata.json (以文件名为 key，无 schema 版本)，用于测迁移
+    rng = random.Random(seed)
+    upload_folder = os.path.join(data_dir, 'upload_folder')
+    dirs = make_dirs(depth, fanout)
+    for rel in dirs:
+        os.makedirs(os.path.join(upload_folder, rel), exist_ok=True)
+
+    metadata = {} if legacy else {SCHEMA_KEY: {'version': SCHEMA_VERSION}}
+    base_ts = 1734709761
+    notes = []
+    for i in range(files):
+        rel_dir = dirs[i % len(dirs)]
+        ts = base_ts + i
+        original_name = f"{rng.choice(WORDS)}_{i}.md"
+        name = f"{ts}_{original_name}"
+        with open(os.path.join(upload_folder, rel_dir, name), 'w', encoding='utf-8') as f:
+            f.write(make_note(rng, note_kb * 1024))
+        owner = rng.choice(USERS) if rng.random() < personal_ratio else 'shared'
+        key = name if legacy else f"{rel_dir}/{name}".lstrip('/')
+        metadata[key] = {
+            'original_name': original_name,
+            'upload_time': str(ts),
+            'edit_time': str(ts + rng.randint(0, 86400)),
+            'owner': owner
+        }
+        notes.append({'dir': rel_dir, 'name': name, 'owner': owner})
+
+    with open(os.path.join(data_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=4)
+    return {'dirs': dirs, 'notes': notes}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python benchmarks/corpus.py 输出目录 [文件数] [目录深度] [每层子目录数] [笔记KB] [个人笔记比例]")
+        sys.exit(1)
+    args = sys.argv[2:]
+    corpus = generate(sys.argv[1],
+                      files=int(args[0]) if len(args) > 0 else 1000,
+                      depth=int(args[1]) if len(args) > 1 else 2,
+                      fanout=int(args[2]) if len(args) > 2 else 4,
+                      note_kb=int(args[3]) if len(args) > 3 else 4,
+                      personal_ratio=float(args[4]) if len(args) > 4 else 0.2)
+    print(f"已生成 {len(corpus['notes'])} 篇笔记, {len(corpus['dirs'])} 个目录")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import tempfile
+import threading
+import statistics
+import subprocess
+import http.client
+from urllib.parse import urlencode, quote
+
+# 多进程并发压测: 启动多个共享同一数据目录的 worker 进程，并发编辑同一批笔记、并发分块上传，
+# 结束后检查没有丢失的编辑 (每次成功保存追加的行都在)、上传的文件完整、版本历史条数一致
+# 用法: python benchmarks/load_test.py [worker进程数] [编辑线程数] [每线程编辑次数] [上传线程数]
+
+ARGS = [] if '--serve' in sys.argv else sys.argv[1:]
+WORKERS = int(ARGS[0]) if len(ARGS) > 0 else 3
+EDIT_THREADS = int(ARGS[1]) if len(ARGS) > 1 else 8
+EDITS_PER_THREAD = int(ARGS[2]) if len(ARGS) > 2 else 25
+UPLOAD_THREADS = int(ARGS[3]) if len(ARGS) > 3 else 4
+UPLOADS_PER_THREAD = 10
+NOTES = 4
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve(port):
+    # worker 进程: 与 gunicorn 一样各自调用 create_app()
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+    from app import create_app
+    make_server('127.0.0.1', port, create_app(), threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def post_form(port, path, fields, headers=None):
+    headers = dict(headers or {}, **{'Content-Type': 'application/x-www-form-urlencoded'})
+    return request(port, 'POST', path, urlencode(fields).encode('utf-8'), headers)
+
+
+def start_workers(data_dir):
+    env = dict(os.environ, DATA_DIR=data_dir)
+    ports = [free_port() for _ in range(WORKERS)]
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)], env=env)
+             for port in ports]
+    deadline = time.monotonic() + 30
+    for port in ports:
+        while True:
+            try:
+                if request(port, 'GET', '/api/dirs')[0] == 200:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("worker 启动超时")
+            time.sleep(0.1)
+    return ports, procs
+
+
+def edit_worker(ports, tid, results):
+    rng = random.Random(tid)
+    for i in range(EDITS_PER_THREAD):
+        note = f"note_{rng.randrange(NOTES)}.md"
+        line = f"edit-{tid}-{i}\n"
+        start = time.perf_counter()
+        while True:
+            port = rng.choice(ports)
+            status, headers, body = request(port, 'GET', '/raw/' + note)
+            status, headers, _ = post_form(port, '/update_file',
+                                           {'dir': '', 'filename': note, 'content': body.decode('utf-8') + line},
+                                           {'If-Match': headers['ETag']})
+            if status == 302:
+                break
+            if status != 412:
+                results['errors'].append(f"update_file {status}")
+                break
+            results['conflicts'] += 1
+        results['latency'].append((time.perf_counter() - start) * 1000)
+        results['saved'].setdefault(note, []).append(line)
+
+
+def upload_worker(ports, tid, results):
+    rng = random.Random(1000 + tid)
+    for i in range(UPLOADS_PER_THREAD):
+        port = rng.choice(ports)
+        # 一半内容彼此重复，顺便覆盖去重存储的并发路径
+        data = (f"# dup {i % 3}\n" if i % 2 else f"# upload {tid}-{i}\n" + 'x' * rng.randint(1, 200000)).encode()
+        status, _, body = post_form(port, '/upload/init', {'dir': 'up', 'filename': f"u{tid}_{i}.md",
+                                                           'size': len(data)})
+        upload_id = json.loads(body)['upload_id']
+        for offset in range(0, len(data), 64 * 1024):
+            chunk = data[offset:offset + 64 * 1024]
+            status, _, body = request(rng.choice(ports), 'PUT', f"/upload/{upload_id}/append?offset={offset}", chunk)
+            if status != 200:
+                results['errors'].append(f"append {status} {body[:80]!r}")
+        status, _, body = request(rng.choice(ports), 'POST', f"/upload/{upload_id}/commit")
+        if status != 200:
+            results['errors'].append(f"commit {status} {body[:80]!r}")
+            continue
+        results['uploads'][json.loads(body)['path']] = data
+
+
+def verify(ports, results):
+    problems = list(results['errors'])
+    for note, lines in results['saved'].items():
+        _, _, body = request(ports[0], 'GET', '/raw/' + note)
+        content = body.decode('utf-8')
+        missing = [line for line in lines if line not in content]
+        if missing:
+            problems.append(f"{note} 丢失 {len(missing)} 次编辑")
+        _, _, body = request(ports[0], 'GET', '/history/' + note)
+        revisions = len(json.loads(body)['revisions'])
+        if revisions != len(lines) + 1:
+            problems.append(f"{note} 版本数 {revisions}, 期望 {len(lines) + 1}")
+    for path, data in results['uploads'].items():
+        status, _, body = request(ports[-1], 'GET', '/raw/' + quote(path))
+        if status != 200 or body != data:
+            problems.append(f"上传 {path} 内容不一致 ({status})")
+    return problems
+
+
+def main():
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.makedirs(os.path.join(data_dir, 'upload_folder', 'up'))
+        ports, procs = start_workers(data_dir)
+        try:
+            for n in range(NOTES):
+                post_form(ports[0], '/create_new_file', {'dir': '', 'new_filename': f"note_{n}", 'content': '# init\n'})
+            results = {'errors': [], 'conflicts': 0, 'latency': [], 'saved': {}, 'uploads': {}}
+            threads = [threading.Thread(target=edit_worker, args=(ports, t, results)) for t in range(EDIT_THREADS)]
+            threads += [threading.Thread(target=upload_worker, args=(ports, t, results)) for t in range(UPLOAD_THREADS)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            problems = verify(ports, results)
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.wait()
+
+    edits = sum(len(lines) for lines in results['saved'].values())
+    latency = sorted(results['latency'])
+    print(f"{WORKERS} 个 worker, {elapsed:.2f}s: 编辑 {edits} 次 ({edits / elapsed:.1f}/s), "
+          f"冲突重试 {results['conflicts']} 次, 上传 {len(results['uploads'])} 个")
+    print(f"保存耗时(含冲突重试) p50 {statistics.median(latency):.1f}ms, p95 {latency[int(len(latency) * 0.95) - 1]:.1f}ms")
+    if problems:
+        print("失败:")
+        for problem in problems:
+            print("  " + problem)
+        sys.exit(1)
+    print("通过: 没有丢失的编辑或上传")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]))
+    else:
+        main()
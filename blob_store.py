@@ -0,0 +1,179 @@
+import os
+import shutil
+import hashlib
+import time
+import uuid
+
+from file_lock import FileLock
+
+# 内容寻址的去重存储
+# 文件内容按 sha256 只保存一份: blobs/objects/ab/abcdef...
+# upload_folder 里的笔记是指向 blob 的硬链接，读文件的代码 (下载、渲染、打包) 不需要任何改动；
+# 引用计数即 inode 的链接数，st_nlink == 1 表示只剩 blob 自身，可以回收
+# 注意: 写笔记必须 写临时文件 + os.replace，不能原地改写，否则会改到所有引用同一 blob 的笔记
+# blobs 目录需与 upload_folder 在同一文件系统；不支持硬链接时退化为复制 (不去重)
+
+READ_SIZE = 64 * 1024
+TMP_TTL = 3600
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        for path in (self.objects_dir, self.tmp_dir):
+            if not os.path.exists(path):
+                os.makedirs(path)
+        # 建链接与回收之间跨进程互斥，避免刚被引用的 blob 被另一个进程回收
+        self._lock = FileLock(os.path.join(root, 'lock'))
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _tmp_path(self):
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    def _finalize(self, tmp_path, digest):
+        # 调用方持有锁: 相同内容已存在时丢弃临时文件，否则移入 objects
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(tmp_path, blob)
+        return blob
+
+    def _link(self, blob, dest_path):
+        # 先在目标目录建好链接再原子替换，读者不会看到写了一半的文件
+        tmp_dest = f"{dest_path}.{uuid.uuid4().hex[:8]}.tmp-link"
+        try:
+            os.link(blob, tmp_dest)
+        except OSError:
+            shutil.copyfile(blob, tmp_dest)
+        os.replace(tmp_dest, dest_path)
+
+    def save_stream(self, stream, dest_path):
+        # 边读边算哈希写到临时文件，返回 digest
+        digest = hashlib.sha256()
+        tmp_path = self._tmp_path()
+        with open(tmp_path, 'wb') as f:
+            while True:
+                buf = stream.read(READ_SIZE)
+                if not buf:
+                    break
+                digest.update(buf)
+                f.write(buf)
+        digest = digest.hexdigest()
+        with self._lock:
+            self._link(self._finalize(tmp_path, digest), dest_path)
+        return digest
+
+    def save_text(self, text, dest_path):
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        tmp_path = self._tmp_path()
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            self._link(self._finalize(tmp_path, digest), dest_path)
+        return digest
+
+    def adopt(self, path):
+        # 把目录树里已有的普通文件纳入 blob 存储 (迁移、分块上传提交后使用)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                buf = f.read(READ_SIZE)
+                if not buf:
+                    break
+                digest.update(buf)
+        digest = digest.hexdigest()
+        with self._lock:
+            blob = self.blob_path(digest)
+            if os.path.exists(blob):
+                if not os.path.samefile(blob, path):
+                    self._link(blob, path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.link(path, blob)
+                except OSError:
+                    shutil.copyfile(path, blob)
+        return digest
+
+    def refcount(self, digest):
+        try:
+            return os.stat(self.blob_path(digest)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def release(self, digest):
+        # 删除笔记后调用: 没有引用的 blob 立即回收
+        if not digest:
+            return False
+        with self._lock:
+            blob = self.blob_path(digest)
+            try:
+                if os.stat(blob).st_nlink <= 1:
+                    os.remove(blob)
+                    return True
+            except FileNotFoundError:
+                pass
+        return False
+
+    def gc(self):
+        # 全量回收: 删除所有没有引用的 blob 和遗留的临时文件，返回 (删除个数, 释放字节数)
+        removed = 0
+        freed = 0
+        now = time.time()
+        with self._lock:
+            for name in os.listdir(self.tmp_dir):
+                path = os.path.join(self.tmp_dir, name)
+                try:
+                    # 正在写入的临时文件不动
+                    if now - os.stat(path).st_mtime > TMP_TTL:
+                        os.remove(path)
+                except OSError:
+                    pass
+            for root, dirs, files in os.walk(self.objects_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                        if st.st_nlink <= 1:
+                            os.remove(path)
+                            removed += 1
+                            freed += st.st_size
+                    except OSError:
+                        pass
+        return removed, freed
+
+
+def dedupe_tree(blob_store, upload_folder, store):
+    # 迁移: 把 upload_folder 里尚未链接到 blob 的文件全部纳入，并在元数据里记录 digest
+    # 返回 (处理文件数, 节省的字节数)
+    processed = 0
+    saved = 0
+    with store.transaction():
+        for root, dirs, files in os.walk(upload_folder):
+            rel_dir = os.path.relpath(root, upload_folder).replace('\\', '/')
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            records = store.list_dir(rel_dir)
+            for name in files:
+                if name.endswith('.tmp-link'):
+                    continue
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                record = records.get(name)
+                if st.st_nlink > 1 and (record is None or record.get('blob')):
+                    # 已经是 blob 的链接
+                    continue
+                digest = blob_store.adopt(path)
+                processed += 1
+                if st.st_nlink == 1 and blob_store.refcount(digest) > 1:
+                    saved += st.st_size
+                if record is not None and record.get('blob') != digest:
+                    record['blob'] = digest
+                    store.put(f"{rel_dir}/{name}" if rel_dir else name, record)
+    return processed, saved
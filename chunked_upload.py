@@ -0,0 +1,196 @@
+import os
+import json
+import errno
+import time
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from file_lock import FileLock
+
+# 分块、可续传的上传
+# 每个上传会话在临时目录下有两个文件: <id>.part 保存已收到的数据, <id>.json 保存会话状态
+# 客户端按 offset 顺序追加分块，断线后查询已确认的 offset 继续上传
+
+READ_SIZE = 64 * 1024
+# os.link 在不支持硬链接的文件系统 (FAT、部分网络盘) 上的错误
+UNSUPPORTED_LINK_ERRORS = (errno.EPERM, errno.EXDEV, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS)
+
+
+class UploadError(Exception):
+    def __init__(self, status, message, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.offset = offset
+
+
+class ChunkedUploads:
+    def __init__(self, tmp_dir, max_concurrent=4, max_chunk_bytes=8 * 1024 * 1024,
+                 session_ttl=24 * 3600):
+        self.tmp_dir = tmp_dir
+        self.max_chunk_bytes = max_chunk_bytes
+        self.session_ttl = session_ttl
+        # 同时写盘的分块数上限，超出时让客户端稍后重试
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._busy = set()
+        if not os.path.exists(tmp_dir):
+            os.makedirs(tmp_dir)
+
+    def _paths(self, upload_id):
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError(404, "上传会话不存在")
+        base = os.path.join(self.tmp_dir, upload_id)
+        return base + '.json', base + '.part'
+
+    @contextmanager
+    def _session_lock(self, upload_id):
+        # 同一会话同时只允许一个写入者，多个 worker 进程之间同样生效
+        self._paths(upload_id)
+        with self._lock:
+            if upload_id in self._busy:
+                raise UploadError(409, "该上传会话正在写入")
+            self._busy.add(upload_id)
+        try:
+            lock = FileLock(os.path.join(self.tmp_dir, upload_id + '.lock'))
+            if not lock.acquire(blocking=False):
+                raise UploadError(409, "该上传会话正在写入")
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            with self._lock:
+                self._busy.discard(upload_id)
+
+    def _remove_lock(self, upload_id):
+        try:
+            os.remove(os.path.join(self.tmp_dir, upload_id + '.lock'))
+        except OSError:
+            pass
+
+    def _load(self, upload_id):
+        state_path, _ = self._paths(upload_id)
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError(404, "上传会话不存在")
+
+    def _save(self, upload_id, state):
+        state_path, _ = self._paths(upload_id)
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, state_path)
+
+    def init(self, dir_path, filename, owner, size=None):
+        self.purge_expired()
+        upload_id = uuid.uuid4().hex
+        state = {
+            'dir': dir_path,
+            'filename': filename,
+            'owner': owner,
+            'size': size,
+            'offset': 0,
+            'created': int(time.time()),
+        }
+        _, part_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        self._save(upload_id, state)
+        return upload_id, state
+
+    def status(self, upload_id):
+        return self._load(upload_id)
+
+    def append(self, upload_id, offset, stream, checksum=None):
+        # 从 stream 读取一个分块写到 offset 处；offset 必须等于已确认的位置
+        if not self._slots.acquire(blocking=False):
+            raise UploadError(429, "同时上传的分块过多，请稍后重试")
+        try:
+            with self._session_lock(upload_id):
+                return self._append(upload_id, offset, stream, checksum)
+        finally:
+            self._slots.release()
+
+    def _append(self, upload_id, offset, stream, checksum):
+        state = self._load(upload_id)
+        if offset != state['offset']:
+            raise UploadError(409, "offset 与服务器记录不一致", state['offset'])
+        _, part_path = self._paths(upload_id)
+        digest = hashlib.sha256()
+        written = 0
+        with open(part_path, 'r+b') as f:
+            f.seek(offset)
+            while True:
+                buf = stream.read(READ_SIZE)
+                if not buf:
+                    break
+                written += len(buf)
+                if written > self.max_chunk_bytes:
+                    f.truncate(offset)
+                    raise UploadError(413, "分块过大", offset)
+                digest.update(buf)
+                f.write(buf)
+            if checksum and checksum.lower() != digest.hexdigest():
+                f.truncate(offset)
+                raise UploadError(400, "分块校验失败", offset)
+            if state['size'] is not None and offset + written > state['size']:
+                f.truncate(offset)
+                raise UploadError(400, "数据超出声明的文件大小", offset)
+            f.truncate(offset + written)
+            f.flush()
+            os.fsync(f.fileno())
+        state['offset'] = offset + written
+        self._save(upload_id, state)
+        return state
+
+    def commit(self, upload_id, dest_path):
+        # 原子地把临时文件改名到目标位置，返回会话状态
+        with self._session_lock(upload_id):
+            state = self._load(upload_id)
+            if state['size'] is not None and state['offset'] != state['size']:
+                raise UploadError(400, "文件尚未上传完整", state['offset'])
+            state_path, part_path = self._paths(upload_id)
+            # 用硬链接代替 exists + replace: 目标已存在时失败，不会覆盖别的进程刚提交的文件
+            if not os.path.isdir(os.path.dirname(dest_path)):
+                raise UploadError(409, "目标目录不存在")
+            try:
+                os.link(part_path, dest_path)
+            except FileExistsError:
+                raise UploadError(409, "目标位置已存在同名文件")
+            except FileNotFoundError:
+                # 检查之后目标目录才被删除
+                raise UploadError(409, "目标目录不存在")
+            except OSError as e:
+                # 只有文件系统不支持硬链接时才退化为 exists + replace
+                if e.errno not in UNSUPPORTED_LINK_ERRORS:
+                    raise
+                if os.path.exists(dest_path):
+                    raise UploadError(409, "目标位置已存在同名文件")
+                os.replace(part_path, dest_path)
+            else:
+                os.remove(part_path)
+            os.remove(state_path)
+        self._remove_lock(upload_id)
+        return state
+
+    def abort(self, upload_id):
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._remove_lock(upload_id)
+
+    def purge_expired(self):
+        now = time.time()
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if now - os.stat(path).st_mtime > self.session_ttl:
+                    os.remove(path)
+            except OSError:
+                pass
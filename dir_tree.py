@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+
+# 内存中的目录树缓存，替代每次页面请求都 os.walk 整个 upload_folder
+# - 应用内的 mkdir / 重命名 / 移动 / 删除 通过 add / move / remove 增量更新
+# - 应用外的修改通过比对目录 mtime 发现 (最多每 check_interval 秒检查一次)
+
+
+def _join(parent, name):
+    return f"{parent}/{name}" if parent else name
+
+
+def _parent(rel):
+    return rel.rpartition('/')[0]
+
+
+class DirTree:
+    def __init__(self, root, check_interval=2.0):
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        # 相对路径 -> [目录 mtime_ns, 子目录名集合]，根目录为 ''
+        self._nodes = {}
+        self._loaded = False
+        self._last_check = 0.0
+
+    def _abs(self, rel):
+        return os.path.join(self.root, rel) if rel else self.root
+
+    def _scan(self, rel):
+        # 只扫描一层; 新出现的子目录递归扫描，消失的子目录连同子树一起移除
+        path = self._abs(rel)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                children = {e.name for e in it if e.is_dir(follow_symlinks=False)}
+        except (FileNotFoundError, NotADirectoryError):
+            self._drop(rel)
+            return
+        old = self._nodes.get(rel)
+        self._nodes[rel] = [mtime, children]
+        if old:
+            for name in old[1] - children:
+                self._drop(_join(rel, name))
+        for name in children:
+            if _join(rel, name) not in self._nodes:
+                self._scan(_join(rel, name))
+
+    def _drop(self, rel):
+        prefix = rel + '/'
+        for key in [k for k in self._nodes if k == rel or k.startswith(prefix)]:
+            del self._nodes[key]
+
+    def _validate(self):
+        for rel in list(self._nodes):
+            node = self._nodes.get(rel)
+            if node is None:
+                continue
+            try:
+                mtime = os.stat(self._abs(rel)).st_mtime_ns
+            except OSError:
+                self._drop(rel)
+                continue
+            if mtime != node[0]:
+                self._scan(rel)
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if not self._loaded:
+            self._nodes = {}
+            self._scan('')
+            self._loaded = True
+            self._last_check = now
+        elif now - self._last_check >= self.check_interval:
+            self._validate()
+            self._last_check = now
+
+    def children(self, rel):
+        # 返回 [(子目录相对路径, 是否还有下级目录)]，目录不存在时返回 None
+        with self._lock:
+            self._ensure_fresh()
+            node = self._nodes.get(rel)
+            if node is None:
+                return None
+            result = []
+            for name in sorted(node[1]):
+                child = self._nodes.get(_join(rel, name))
+                result.append((_join(rel, name), bool(child and child[1])))
+            return result
+
+    def add(self, rel):
+        with self._lock:
+            if self._loaded:
+                # 可能一次创建了多级目录，从最近的已知祖先开始扫描
+                parent = _parent(rel)
+                while parent and parent not in self._nodes:
+                    parent = _parent(parent)
+                self._scan(parent)
+
+    def remove(self, rel):
+        with self._lock:
+            if self._loaded:
+                self._drop(rel)
+                self._scan(_parent(rel))
+
+    def move(self, old_rel, new_rel):
+        # 直接改写子树的 key，避免重新扫描整棵被移动的子树
+        with self._lock:
+            if not self._loaded:
+                return
+            prefix = old_rel + '/'
+            moved = [k for k in self._nodes if k == old_rel or k.startswith(prefix)]
+            for key in moved:
+                self._nodes[new_rel + key[len(old_rel):]] = self._nodes.pop(key)
+            self._scan(_parent(old_rel))
+            self._scan(_parent(new_rel))
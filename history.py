@@ -0,0 +1,243 @@
+import json
+import time
+import zlib
+import difflib
+import threading
+
+from sqlite_util import SqliteMixin
+
+# 笔记的版本历史，保存在独立的 SQLite 库
+# - 每个版本默认保存为相对上一版本的行级差异 (zlib 压缩)
+# - 每 keyframe_interval 个版本 (或差异不比全文小时) 保存一次完整内容作为关键帧，
+#   还原某个版本只需读取 最近的关键帧 .. 该版本 这一段
+# - 保留策略: 最多保留 max_revisions 个版本 / max_age 秒内的版本 (0 表示不限)，
+#   超出时压缩: 把最早保留的版本改写为关键帧，再删除更早的版本
+
+FULL = 0
+DELTA = 1
+
+
+def _lines(text):
+    return text.splitlines(keepends=True)
+
+
+def make_delta(old_lines, new_lines):
+    # 操作序列: [i1, i2] 复制旧版本的 i1..i2 行, ["..."] 插入新行
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append([''.join(new_lines[j1:j2])])
+    return ops
+
+
+def apply_delta(old_lines, ops):
+    out = []
+    for op in ops:
+        if isinstance(op[0], int):
+            out.extend(old_lines[op[0]:op[1]])
+        else:
+            out.extend(_lines(op[0]))
+    return out
+
+
+def _pack(obj):
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+class VersionHistory(SqliteMixin):
+    def __init__(self, path, keyframe_interval=50, max_revisions=0, max_age=0):
+        self.path = path
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.max_revisions = max_revisions
+        self.max_age = max_age
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS revisions ('
+            ' path TEXT,'
+            ' rev INTEGER,'
+            ' ts INTEGER,'
+            ' author TEXT,'
+            ' kind INTEGER,'
+            ' size INTEGER,'
+            ' data BLOB,'
+            ' PRIMARY KEY (path, rev))'
+        )
+
+
+    def _head(self, key):
+        # 最新版本号和距离最近关键帧的版本数
+        conn = self._connect()
+        row = conn.execute('SELECT MAX(rev) FROM revisions WHERE path = ?', (key,)).fetchone()
+        if row[0] is None:
+            return 0, 0
+        base = conn.execute('SELECT MAX(rev) FROM revisions WHERE path = ? AND kind = ?',
+                            (key, FULL)).fetchone()[0]
+        return row[0], row[0] - base
+
+    def _insert(self, key, rev, ts, author, text, prev_text, since_keyframe):
+        data = zlib.compress(text.encode('utf-8'))
+        kind = FULL
+        if prev_text is not None and since_keyframe + 1 < self.keyframe_interval:
+            delta = _pack(make_delta(_lines(prev_text), _lines(text)))
+            if len(delta) < len(data):
+                data, kind = delta, DELTA
+        self._connect().execute(
+            'INSERT INTO revisions (path, rev, ts, author, kind, size, data) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, rev, ts, author, kind, len(text.encode('utf-8')), data))
+        return kind
+
+    def record(self, key, text, author='', ts=None):
+        # 保存新版本，返回版本号；内容与最新版本相同时不新增
+        ts = int(time.time()) if ts is None else ts
+        with self.transaction():
+            head, since_keyframe = self._head(key)
+            prev_text = self.get(key, head) if head else None
+            if prev_text == text:
+                return head
+            self._insert(key, head + 1, ts, author, text, prev_text, since_keyframe)
+            if self._over_limit(key, head + 1, ts):
+                self.compact(key)
+        return head + 1
+
+    def _over_limit(self, key, head, now):
+        # 超出保留策略一定余量 (一个关键帧间隔 / 一天) 后才压缩，避免每次保存都改写
+        if self.max_revisions and head - self._first(key) + 1 > self.max_revisions + self.keyframe_interval:
+            return True
+        if self.max_age:
+            row = self._connect().execute('SELECT MIN(ts) FROM revisions WHERE path = ?', (key,)).fetchone()
+            return row[0] is not None and row[0] < now - self.max_age - 86400
+        return False
+
+    def _first(self, key):
+        row = self._connect().execute('SELECT MIN(rev) FROM revisions WHERE path = ?', (key,)).fetchone()
+        return row[0] or 0
+
+    def exists(self, key):
+        # 是否已有任何版本，保存时只需要这一次按主键前缀的查询
+        return self._connect().execute(
+            'SELECT 1 FROM revisions WHERE path = ? LIMIT 1', (key,)).fetchone() is not None
+
+    def latest_rev(self, key):
+        # 最新版本号，没有历史时为 None
+        return self._connect().execute('SELECT MAX(rev) FROM revisions WHERE path = ?', (key,)).fetchone()[0]
+
+    def revisions(self, key):
+        # 只读版本元信息，不读内容
+        rows = self._connect().execute(
+            'SELECT rev, ts, author, kind, size, length(data) FROM revisions WHERE path = ? ORDER BY rev DESC',
+            (key,)).fetchall()
+        return [{'rev': r[0], 'time': r[1], 'author': r[2], 'keyframe': r[3] == FULL,
+                 'size': r[4], 'stored': r[5]} for r in rows]
+
+    def get(self, key, rev=None):
+        # 还原某个版本: 读取 最近的关键帧 .. rev 并依次应用差异；不存在时返回 None
+        conn = self._connect()
+        if rev is None:
+            rev = self.latest_rev(key)
+            if rev is None:
+                return None
+        base = conn.execute('SELECT MAX(rev) FROM revisions WHERE path = ? AND rev <= ? AND kind = ?',
+                            (key, rev, FULL)).fetchone()[0]
+        if base is None:
+            return None
+        rows = conn.execute('SELECT rev, kind, data FROM revisions WHERE path = ? AND rev BETWEEN ? AND ? ORDER BY rev',
+                            (key, base, rev)).fetchall()
+        if not rows or rows[-1][0] != rev:
+            return None
+        lines = None
+        for _, kind, data in rows:
+            if kind == FULL:
+                lines = _lines(zlib.decompress(data).decode('utf-8'))
+            else:
+                lines = apply_delta(lines, _unpack(data))
+        return ''.join(lines)
+
+    def _decode_from(self, key, keep):
+        # 从 keep 第一个版本之前的关键帧开始顺序解码一遍，返回 [(row, text)]
+        conn = self._connect()
+        base = conn.execute('SELECT MAX(rev) FROM revisions WHERE path = ? AND rev <= ? AND kind = ?',
+                            (key, keep[0][0], FULL)).fetchone()[0]
+        wanted = {r[0]: r for r in keep}
+        texts = []
+        lines = None
+        for rev, kind, data in conn.execute('SELECT rev, kind, data FROM revisions WHERE path = ? AND rev >= ? ORDER BY rev',
+                                            (key, base)).fetchall():
+            if kind == FULL:
+                lines = _lines(zlib.decompress(data).decode('utf-8'))
+            else:
+                lines = apply_delta(lines, _unpack(data))
+            if rev in wanted:
+                texts.append((wanted[rev], ''.join(lines)))
+        return texts
+
+    def diff(self, key, from_rev, to_rev):
+        old = self.get(key, from_rev)
+        new = self.get(key, to_rev)
+        if old is None or new is None:
+            return None
+        return ''.join(difflib.unified_diff(_lines(old), _lines(new), f'{key}@{from_rev}', f'{key}@{to_rev}'))
+
+    def compact(self, key, max_revisions=None, max_age=None, now=None):
+        # 按保留策略删除旧版本，并把剩余版本按当前关键帧间隔重新编码；返回删除的版本数
+        max_revisions = self.max_revisions if max_revisions is None else max_revisions
+        max_age = self.max_age if max_age is None else max_age
+        now = int(time.time()) if now is None else now
+        with self.transaction():
+            conn = self._connect()
+            rows = conn.execute('SELECT rev, ts, author FROM revisions WHERE path = ? ORDER BY rev',
+                                (key,)).fetchall()
+            if not rows:
+                return 0
+            keep = rows
+            if max_revisions:
+                keep = keep[-max_revisions:]
+            if max_age:
+                # 最新版本总是保留
+                keep = [r for r in keep[:-1] if r[1] >= now - max_age] + keep[-1:]
+            texts = self._decode_from(key, keep)
+            conn.execute('DELETE FROM revisions WHERE path = ?', (key,))
+            prev_text = None
+            since_keyframe = 0
+            for (rev, ts, author), text in texts:
+                kind = self._insert(key, rev, ts, author, text, prev_text, since_keyframe)
+                since_keyframe = 0 if kind == FULL else since_keyframe + 1
+                prev_text = text
+        return len(rows) - len(keep)
+
+    def paths(self):
+        return [row[0] for row in self._connect().execute('SELECT DISTINCT path FROM revisions')]
+
+    def move(self, old_key, new_key):
+        # 只有源有历史、会替换目标时才删除目标原有的历史
+        if old_key == new_key or not self.exists(old_key):
+            return
+        with self.transaction():
+            conn = self._connect()
+            conn.execute('DELETE FROM revisions WHERE path = ?', (new_key,))
+            conn.execute('UPDATE revisions SET path = ? WHERE path = ?', (new_key, old_key))
+
+    def remove(self, key):
+        self._connect().execute('DELETE FROM revisions WHERE path = ?', (key,))
+
+    def remove_prefix(self, prefix):
+        self._connect().execute("DELETE FROM revisions WHERE path >= :p || '/' AND path < :p || '0'",
+                                {'p': prefix})
+
+    def move_prefix(self, old_prefix, new_prefix):
+        # 目标子树下只删除会被源历史替换的路径，其余笔记的历史保留
+        if old_prefix == new_prefix:
+            return
+        params = {'old': old_prefix, 'new': new_prefix, 'n': len(old_prefix) + 1}
+        where = "path >= :old || '/' AND path < :old || '0'"
+        with self.transaction():
+            conn = self._connect()
+            conn.execute(f'DELETE FROM revisions WHERE path IN'
+                         f' (SELECT DISTINCT :new || substr(path, :n) FROM revisions WHERE {where})', params)
+            conn.execute(f'UPDATE revisions SET path = :new || substr(path, :n) WHERE {where}', params)
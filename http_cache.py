@@ -0,0 +1,39 @@
+import os
+from datetime import datetime, timezone
+
+from flask import request, Response
+from werkzeug.http import is_resource_modified
+
+# 笔记相关响应的 HTTP 缓存
+# - 强 ETag 由文件 mtime_ns + size 得出，只需一次 stat，不必读文件或渲染；Last-Modified 取 edit_time 与 mtime 中较新的
+# - 共享笔记允许共享缓存(反向代理)保存，个人笔记只允许浏览器私有缓存
+# - 两者都要求每次使用前重新验证 (no-cache)，命中时返回 304
+
+
+def file_validators(full_path, variant='', edit_time=None):
+    # variant 区分同一文件的不同表示 (原文 / 渲染后的 HTML)
+    # Last-Modified 取 edit_time 与文件 mtime 中较新的一个: 笔记是 blob 的硬链接，改回旧内容时会链接到旧 blob，
+    # mtime 随之倒退；而应用外的修改 (同步工具等) 不会更新 edit_time
+    st = os.stat(full_path)
+    etag = f"{variant}{st.st_mtime_ns:x}-{st.st_size:x}"
+    last_modified = datetime.fromtimestamp(int(max(int(edit_time or 0), st.st_mtime)), timezone.utc)
+    return etag, last_modified
+
+
+def apply_cache_policy(response, owner):
+    if owner == 'shared':
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified, owner):
+    # 客户端缓存仍然有效时返回 304 响应，否则返回 None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return apply_cache_policy(response, owner)
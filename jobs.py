@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from file_lock import FileLock
+from sqlite_util import SqliteMixin
+
+# 本地后台任务队列: 线程池执行，任务状态持久化在 SQLite
+# - 批量操作按条目记录进度 (checkpoint)，进程重启后从上次完成的位置继续
+# - 取消请求在条目之间生效
+# - 每个条目的操作本身需要是幂等的，重复执行同一条目不会出错
+# - 多个 worker 进程共用同一个库: 任务由某个进程原子地认领 (runner)，
+#   进程存活期间持有 <db>.runners/<runner>.lock，锁可被获取说明该进程已退出，其任务可以接管
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, queue, row):
+        self._queue = queue
+        self.id = row['id']
+        self.kind = row['kind']
+        self.params = json.loads(row['params'])
+        self.state = json.loads(row['state'] or '{}')
+        self.done = row['done']
+        self.total = row['total']
+        self.messages = json.loads(row['messages'] or '[]')
+
+    def cancelled(self):
+        return self._queue._cancel_requested(self.id)
+
+    def set_total(self, total):
+        self.total = total
+        self._queue._update(self.id, total=total)
+
+    def checkpoint(self, message=None, **state):
+        # 完成一个条目: 保存进度、消息和自定义状态
+        self.done += 1
+        if message:
+            self.messages.append(message)
+        self.state.update(state)
+        self._queue._update(self.id, done=self.done, messages=json.dumps(self.messages, ensure_ascii=False),
+                            state=json.dumps(self.state, ensure_ascii=False))
+
+    def save_state(self, **state):
+        # 条目执行到一半时保存自定义状态 (例如不可重复的文件系统操作即将执行)，续跑时据此判断
+        self.state.update(state)
+        self._queue._update(self.id, state=json.dumps(self.state, ensure_ascii=False))
+
+    def for_each(self, items, func):
+        # 依次处理 items，跳过已完成的条目；func 返回要记录的消息
+        self.set_total(len(items))
+        for item in items[self.done:]:
+            if self.cancelled():
+                raise JobCancelled()
+            self.checkpoint(func(item))
+
+
+class JobQueue(SqliteMixin):
+    row_factory = sqlite3.Row
+
+    def __init__(self, db_path, workers=2, job_ttl=7 * 24 * 3600):
+        self.path = db_path
+        # 已结束的任务 (完成 / 失败 / 取消) 保留多久，提交新任务时清理
+        self.job_ttl = job_ttl
+        self._handlers = {}
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.runner = uuid.uuid4().hex
+        self._runners_dir = db_path + '.runners'
+        if not os.path.exists(self._runners_dir):
+            os.makedirs(self._runners_dir, exist_ok=True)
+        self._runner_lock = FileLock(os.path.join(self._runners_dir, self.runner + '.lock'))
+        self._runner_lock.acquire()
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' kind TEXT,'
+            ' params TEXT,'
+            ' status TEXT,'
+            ' done INTEGER DEFAULT 0,'
+            ' total INTEGER DEFAULT 0,'
+            ' messages TEXT,'
+            ' state TEXT,'
+            ' result TEXT,'
+            ' error TEXT,'
+            ' cancel_requested INTEGER DEFAULT 0,'
+            ' runner TEXT,'
+            ' created INTEGER,'
+            ' updated INTEGER)'
+        )
+        if 'runner' not in [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]:
+            conn.execute('ALTER TABLE jobs ADD COLUMN runner TEXT')
+
+    def _update(self, job_id, **fields):
+        fields['updated'] = int(time.time())
+        assignments = ', '.join(f'{name} = :{name}' for name in fields)
+        self._connect().execute(f'UPDATE jobs SET {assignments} WHERE id = :id', dict(fields, id=job_id))
+
+    def _cancel_requested(self, job_id):
+        row = self._connect().execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def register(self, kind, handler):
+        # handler(job) 返回值 (可 JSON 序列化) 作为任务结果保存
+        self._handlers[kind] = handler
+
+    def submit(self, kind, params):
+        if kind not in self._handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        now = int(time.time())
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, params, status, messages, state, created, updated)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(params, ensure_ascii=False), QUEUED, '[]', '{}', now, now))
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def purge_expired(self):
+        cur = self._connect().execute(
+            'DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated < ?',
+            (DONE, FAILED, CANCELLED, int(time.time() - self.job_ttl)))
+        return cur.rowcount
+
+    def _runner_alive(self, runner):
+        if runner == self.runner:
+            return True
+        if not runner:
+            return False
+        path = os.path.join(self._runners_dir, runner + '.lock')
+        if not os.path.exists(path):
+            return False
+        lock = FileLock(path)
+        if not lock.acquire(blocking=False):
+            return True
+        lock.release()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+    def resume(self):
+        # 启动时重新调度未完成的任务: 排队中的，以及执行进程已经退出的
+        rows = self._connect().execute(
+            'SELECT id, status, runner FROM jobs WHERE status IN (?, ?) ORDER BY created', (QUEUED, RUNNING)).fetchall()
+        count = 0
+        for row in rows:
+            if row['status'] == RUNNING and self._runner_alive(row['runner']):
+                continue
+            self._executor.submit(self._run, row['id'], row['runner'])
+            count += 1
+        return count
+
+    def _claim(self, job_id, previous_runner):
+        # 只有一个进程能把任务从 排队 / 已退出进程的运行中 改为自己运行
+        cur = self._connect().execute(
+            'UPDATE jobs SET status = ?, runner = ?, updated = ?'
+            ' WHERE id = ? AND (status = ? OR (status = ? AND runner IS ?))',
+            (RUNNING, self.runner, int(time.time()), job_id, QUEUED, RUNNING, previous_runner))
+        return cur.rowcount == 1
+
+    def _run(self, job_id, previous_runner=None):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None or row['status'] not in (QUEUED, RUNNING):
+            return
+        if row['cancel_requested']:
+            self._update(job_id, status=CANCELLED)
+            return
+        if not self._claim(job_id, previous_runner):
+            return
+        job = Job(self, row)
+        try:
+            result = self._handlers[job.kind](job)
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}")
+        else:
+            self._update(job_id, status=DONE, result=json.dumps(result, ensure_ascii=False))
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'done': row['done'],
+            'total': row['total'],
+            'messages': json.loads(row['messages'] or '[]'),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'cancel_requested': bool(row['cancel_requested']),
+            'created': row['created'],
+            'updated': row['updated'],
+        }
+
+    def cancel(self, job_id):
+        # 排队中的任务直接取消；运行中的任务在处理下一个条目前停止
+        conn = self._connect()
+        conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)',
+                     (job_id, QUEUED, RUNNING))
+        return self.get(job_id)
@@ -0,0 +1,120 @@
+import os
+import json
+import base64
+from bisect import bisect_left, bisect_right
+
+import metrics
+
+# 目录列表: os.scandir 一次拿到条目类型 (不再逐个 isdir)，
+# 文件夹按名称排在前面，文件按 名称 / 上传时间 / 编辑时间 (数值) 排序，
+# 分页使用基于排序键的游标，翻页期间增删条目不会导致重复或遗漏
+
+SORT_FIELDS = ('name', 'upload_time', 'edit_time')
+
+
+class CursorError(ValueError):
+    pass
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def scan_directory(browse_path, records, search_keyword=''):
+    # 返回 (文件夹名列表, 文件列表)，文件带原始的数值时间
+    keyword = search_keyword.lower()
+    folders = []
+    files = []
+    scanned = 0
+    with os.scandir(browse_path) as it:
+        for entry in it:
+            scanned += 1
+            if entry.is_dir():
+                if keyword and keyword not in entry.name.lower():
+                    continue
+                folders.append(entry.name)
+            elif entry.name.lower().endswith('.md'):
+                file_meta = records.get(entry.name, {})
+                original_name = file_meta.get('original_name', entry.name)
+                if keyword and keyword not in original_name.lower():
+                    continue
+                files.append({
+                    'name': entry.name,
+                    'original_name': original_name,
+                    'upload_time': _to_int(file_meta.get('upload_time')) or None,
+                    'edit_time': _to_int(file_meta.get('edit_time')) or None,
+                    'owner': file_meta.get('owner', 'shared')
+                })
+    metrics.inc('files_scanned_total', scanned)
+    return folders, files
+
+
+def _file_key(f, sort_by):
+    if sort_by == 'upload_time':
+        return (f['upload_time'] or 0, f['name'])
+    if sort_by == 'edit_time':
+        return (f['edit_time'] or 0, f['name'])
+    return (f['original_name'].lower(), f['name'])
+
+
+def encode_cursor(group, key, sort_by, order):
+    raw = json.dumps([group, list(key), sort_by, order], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_by, order):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        group, key, c_sort_by, c_order = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        raise CursorError("无效的游标")
+    if (c_sort_by, c_order) != (sort_by, order) or group not in (0, 1) or len(key) != 2:
+        raise CursorError("游标与排序方式不匹配")
+    expected = int if group == 1 and sort_by != 'name' else str
+    if not isinstance(key[0], expected) or isinstance(key[0], bool) or not isinstance(key[1], str):
+        raise CursorError("无效的游标")
+    return group, tuple(key)
+
+
+def paginate(folders, files, sort_by='name', order='asc', cursor=None, limit=None):
+    # 返回 (本页文件夹, 本页文件, 下一页游标或 None)
+    if sort_by not in SORT_FIELDS:
+        sort_by = 'name'
+    reverse = (order == 'desc')
+    order = 'desc' if reverse else 'asc'
+
+    folders = sorted(folders, key=lambda name: (name.lower(), name))
+    folder_keys = [(name.lower(), name) for name in folders]
+    files = sorted(files, key=lambda f: _file_key(f, sort_by))
+    file_keys = [_file_key(f, sort_by) for f in files]
+    if reverse:
+        files.reverse()
+        file_keys.reverse()
+
+    folder_start, file_start = 0, 0
+    if cursor:
+        group, key = decode_cursor(cursor, sort_by, order)
+        if group == 0:
+            folder_start = bisect_right(folder_keys, key)
+        else:
+            folder_start = len(folders)
+            if reverse:
+                file_start = len(files) - bisect_left(file_keys[::-1], key)
+            else:
+                file_start = bisect_right(file_keys, key)
+
+    page_folders = folders[folder_start:]
+    page_files = files[file_start:]
+    if limit is None or len(page_folders) + len(page_files) <= limit:
+        return page_folders, page_files, None
+
+    page_folders = page_folders[:limit]
+    page_files = page_files[:limit - len(page_folders)]
+    if page_files:
+        next_cursor = encode_cursor(1, file_keys[file_start + len(page_files) - 1], sort_by, order)
+    else:
+        next_cursor = encode_cursor(0, folder_keys[folder_start + len(page_folders) - 1], sort_by, order)
+    return page_folders, page_files, next_cursor
@@ -0,0 +1,248 @@
+import os
+import re
+import html
+import hashlib
+import threading
+import importlib.util
+from collections import OrderedDict
+
+# Markdown 渲染管线
+# - 扩展列表可配置；加载好扩展的 Markdown 实例放在空闲池里复用 (实例不是线程安全的，同一时刻只给一个渲染用)，
+#   转换前 reset()。用池而不是 threading.local: 每个请求一个新线程的服务器上也不必反复构建实例
+# - markdown / pygments 在第一次渲染 (或 warm()) 时才导入，进程启动时不付这部分开销；
+#   扩展名在构造时就检查 (不导入 markdown)，配置写错时启动即报错
+# - fenced_code / codehilite 由本模块的代码块预处理器代替: 高亮结果按 (语言, 代码) 的哈希缓存，
+#   同一段代码在不同笔记、同一笔记的多次渲染之间只高亮一次
+# - render_blocks() 把文档按块切分，只渲染没见过的块，供编辑时的实时预览使用；
+#   同一个列表 (含空行分隔的各项) 是一块，含 [TOC] 的文档整篇作为一块。
+#   已知的差异: 重名标题的 id 不会加 _1 后缀，脚注 (footnotes 扩展) 的引用与定义不在同一块时不会链接
+
+# 与 markdown.extensions.fenced_code 的写法一致: ```lang / ~~~lang 开头，同样的围栏结尾
+FENCE_RE = re.compile(
+    r'^(?P<fence>`{3,}|~{3,})[ \t]*\{?\.?(?P<lang>[\w#.+-]*)\}?[^\n]*\n'
+    r'(?P<code>.*?)(?<=\n)(?P=fence)[ \t]*$',
+    re.MULTILINE | re.DOTALL)
+# 引用式链接的定义 ([id]: url)，预览时附加到每个块后面，块内的 [text][id] 才能解析
+REF_DEF_RE = re.compile(r' {0,3}\[(?!\^)[^\]]+\]:[ \t]*\S')
+# 列表项开头 (与 markdown 的 ulist / olist 一致)；空行后的列表项接在以列表开头的块后面，属于同一个列表
+LIST_ITEM_RE = re.compile(r' {0,3}(?:[*+-]|\d+\.)[ \t]+\S')
+TOC_MARKER = '[TOC]'
+
+CODE_EXTENSIONS = ('fenced_code', 'codehilite')
+
+# pygments.lexers / pygments.formatters 是惰性加载的包装模块，多个线程同时第一次导入时
+# 可能拿到未初始化完的模块 (ImportError: cannot import name 'HtmlFormatter')，只在锁内导入一次
+_import_lock = threading.Lock()
+_pygments = None
+
+
+def _load_pygments():
+    global _pygments
+    if _pygments is None:
+        with _import_lock:
+            if _pygments is None:
+                from pygments import highlight
+                from pygments.lexers import get_lexer_by_name
+                from pygments.formatters import HtmlFormatter
+                from pygments.util import ClassNotFound
+                _pygments = (highlight, get_lexer_by_name, HtmlFormatter, ClassNotFound)
+    return _pygments
+
+
+def check_extensions(names):
+    # 不导入 markdown 检查扩展名: 内置扩展只看 markdown/extensions/ 下有没有同名模块，
+    # 模块路径 (a.b 或 a.b:Class) 查 import 路径，其余短名再查第三方注册的 entry points
+    spec = importlib.util.find_spec('markdown')
+    if spec is None:
+        raise ImportError("未安装 markdown")
+    builtin_dir = os.path.join(os.path.dirname(spec.origin), 'extensions')
+    registered = None
+    for name in names:
+        module = name.partition(':')[0]
+        if '.' in module:
+            try:
+                found = importlib.util.find_spec(module) is not None
+            except ImportError:
+                found = False
+        else:
+            found = os.path.exists(os.path.join(builtin_dir, module + '.py'))
+            if not found:
+                if registered is None:
+                    from importlib.metadata import entry_points
+                    registered = {ep.name for ep in entry_points(group='markdown.extensions')}
+                found = module in registered
+        if not found:
+            raise ValueError(f"未知的 Markdown 扩展: {name}")
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class _CodeBlockPreprocessor:
+    # 直接注册到 md.preprocessors (只需要 run)，不必在模块导入时就加载 markdown 的基类
+    def __init__(self, md, pipeline):
+        self.md = md
+        self.pipeline = pipeline
+
+    def run(self, lines):
+        text = '\n'.join(lines)
+
+        def replace(m):
+            placeholder = self.md.htmlStash.store(self.pipeline.highlight_code(m.group('code'), m.group('lang')))
+            return f'\n\n{placeholder}\n\n'
+        return FENCE_RE.sub(replace, text).split('\n')
+
+
+def split_blocks(text):
+    # 按空行切块: 围栏代码块整体作为一块；空行后缩进的行 (列表续行、缩进代码) 仍归前一块，
+    # 以列表开头的块在空行后遇到新的列表项也仍是同一块 (否则会被渲染成多个各自从 1 编号的列表)
+    # 返回 (块列表, 引用式链接定义的行)；逐行只做字符串比较，长文档也只需一遍扫描
+    blocks = []
+    refs = []
+    current = []
+    fence = None
+    blank = False
+    in_list = False
+    for line in text.split('\n'):
+        if fence is not None:
+            current.append(line)
+            if line.rstrip(' \t') == fence:
+                blocks.append('\n'.join(current))
+                current, fence = [], None
+            continue
+        if not line or line.isspace():
+            blank = bool(current)
+            continue
+        head = line[:3]
+        if head == '```' or head == '~~~':
+            if current:
+                blocks.append('\n'.join(current))
+            current = [line]
+            fence = line[:len(line) - len(line.lstrip(head[0]))]
+            blank = False
+            continue
+        if blank:
+            if line[0] not in ' \t' and not (in_list and LIST_ITEM_RE.match(line)):
+                blocks.append('\n'.join(current))
+                current = []
+            else:
+                current.append('')
+            blank = False
+        if not current:
+            in_list = LIST_ITEM_RE.match(line) is not None
+        if '[' in head and REF_DEF_RE.match(line):
+            refs.append(line)
+        current.append(line)
+    if current:
+        blocks.append('\n'.join(current))
+    return blocks, refs
+
+
+class MarkdownPipeline:
+    def __init__(self, extensions, code_style='default', code_cache_entries=2048, block_cache_entries=8192):
+        names = [name.strip() for name in extensions if name.strip()]
+        check_extensions(names)
+        self.highlight = 'codehilite' in names and importlib.util.find_spec('pygments') is not None
+        self.fenced = any(name in CODE_EXTENSIONS for name in names)
+        self.extensions = [name for name in names if name not in CODE_EXTENSIONS]
+        self.toc = 'toc' in names
+        self.code_style = code_style
+        # 配置变化后渲染结果也会变，磁盘缓存、ETag 要带上它
+        self.signature = hashlib.sha1(f"{','.join(names)}|{code_style}".encode('utf-8')).hexdigest()[:12]
+        self.code_cache = _LRU(code_cache_entries)
+        self.block_cache = _LRU(block_cache_entries)
+        # 空闲的 Markdown 实例；list 的 pop / append 本身是原子的
+        self._idle = []
+
+    def _build(self):
+        import markdown
+        md = markdown.Markdown(extensions=self.extensions)
+        if self.fenced:
+            # 优先级与 fenced_code 相同: 在 normalize_whitespace 之后、html_block 之前
+            md.preprocessors.register(_CodeBlockPreprocessor(md, self), 'fenced_code_block', 25)
+        return md
+
+    def warm(self):
+        # 启动预热: 导入 markdown / pygments 并预先建好一个实例
+        self._idle.append(self._build())
+        self.css()
+
+    def render(self, text):
+        try:
+            md = self._idle.pop()
+        except IndexError:
+            md = self._build()
+        try:
+            return md.reset().convert(text)
+        finally:
+            self._idle.append(md)
+
+    def highlight_code(self, code, lang):
+        key = hashlib.sha1(f"{lang}\0{code}".encode('utf-8')).digest()
+        result = self.code_cache.get(key)
+        if result is not None:
+            return result
+        if self.highlight:
+            highlight, get_lexer_by_name, HtmlFormatter, ClassNotFound = _load_pygments()
+            try:
+                lexer = get_lexer_by_name(lang) if lang else get_lexer_by_name('text')
+            except ClassNotFound:
+                lexer = get_lexer_by_name('text')
+            result = highlight(code, lexer, HtmlFormatter(cssclass='codehilite', style=self.code_style))
+        else:
+            lang_class = f' class="language-{html.escape(lang)}"' if lang else ''
+            result = f'<pre><code{lang_class}>{html.escape(code)}</code></pre>\n'
+        self.code_cache.put(key, result)
+        return result
+
+    def css(self):
+        # 代码高亮的样式表；没有安装 pygments 或没启用 codehilite 时为空
+        if not self.highlight:
+            return ''
+        HtmlFormatter = _load_pygments()[2]
+        return HtmlFormatter(style=self.code_style).get_style_defs('.codehilite')
+
+    def render_blocks(self, text, known=()):
+        # 返回 [{'id': 块 id, 'html': ...}]，前端已有 (id 在 known 里) 的块省略 html
+        # 块缓存以 (引用定义, 块原文) 为 key，未变化的块既不渲染也不重新计算 id
+        if self.toc and TOC_MARKER in text:
+            # 目录需要看到全部标题
+            blocks, refs = [text], ''
+        else:
+            blocks, refs = split_blocks(text)
+            refs = '\n'.join(refs)
+        result = []
+        for block in blocks:
+            entry = self.block_cache.get((refs, block))
+            if entry is None:
+                block_id = hashlib.sha1(f"{self.signature}\0{refs}\0{block}".encode('utf-8')).hexdigest()[:20]
+                entry = (block_id, self.render(f"{block}\n\n{refs}" if refs else block))
+                self.block_cache.put((refs, block), entry)
+            if entry[0] in known:
+                result.append({'id': entry[0]})
+            else:
+                result.append({'id': entry[0], 'html': entry[1]})
+        return result
@@ -0,0 +1,318 @@
+import os
+import json
+import posixpath
+import threading
+from contextlib import contextmanager
+
+from file_lock import FileLock
+from sqlite_util import SqliteMixin
+
+# 元数据存储后端：统一的 get / put / delete 语义
+# - JsonMetadataStore: 兼容旧的 metadata.json，事务结束时整体写回一次
+# - SqliteMetadataStore: SQLite WAL 模式，按记录更新，每个请求一个事务
+# 记录的 key 为相对 upload_folder 的规范化路径，如 'notes/a.md'，根目录下为 'a.md'
+
+FIELDS = ('original_name', 'upload_time', 'edit_time', 'owner')
+COLUMNS = ('name', 'dir') + FIELDS + ('extra',)
+# 1: 以文件名为 key; 2: 以相对路径为 key
+SCHEMA_VERSION = 2
+SCHEMA_KEY = '__schema__'
+
+
+def make_key(*parts):
+    path = '/'.join(p.replace('\\', '/').strip('/') for p in parts if p and p.strip('/'))
+    if not path:
+        return ''
+    path = posixpath.normpath(path)
+    return '' if path == '.' else path
+
+
+def split_key(key):
+    d, _, name = key.rpartition('/')
+    return d, name
+
+
+def _in_subtree(key, prefix):
+    return key.startswith(prefix + '/')
+
+
+class JsonMetadataStore:
+    def __init__(self, path):
+        self.path = path
+        # 多进程部署时整文件 读-改-写 需要跨进程互斥
+        self._lock = FileLock(path + '.lock')
+        self._local = threading.local()
+        # 累计解析过的 metadata.json 字节数 (指标)
+        self.bytes_parsed = 0
+        # (文件的 mtime_ns, size, inode), 解析结果: 文件没变时不再重复解析，其他进程写入后按 stat 发现
+        self._cache = None
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _load(self):
+        # 返回的是共享的缓存，只能读；事务里要修改的数据用 _load_copy()
+        stamp = self._stamp()
+        if stamp is None:
+            return {}
+        cache = self._cache
+        if cache is not None and cache[0] == stamp:
+            return cache[1]
+        with open(self.path, 'r', encoding='utf-8') as f:
+            raw = f.read()
+        self.bytes_parsed += len(raw)
+        data = json.loads(raw)
+        self._cache = (stamp, data)
+        return data
+
+    def _load_copy(self):
+        # 记录都是一层的 dict，逐条浅拷贝比重新解析 JSON 快得多
+        return {key: dict(record) for key, record in self._load().items()}
+
+    def _save(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+        # 刚写入的数据就是文件内容，直接作为新的缓存
+        self._cache = (self._stamp(), data)
+
+    def _data(self):
+        # 事务内复用同一份数据，事务外读缓存 (文件变了才重新解析)
+        data = getattr(self._local, 'data', None)
+        return data if data is not None else self._load()
+
+    def warm(self):
+        self._load()
+
+    @contextmanager
+    def transaction(self):
+        if getattr(self._local, 'depth', 0):
+            self._local.depth += 1
+            try:
+                yield self
+            finally:
+                self._local.depth -= 1
+            return
+        with self._lock:
+            self._local.depth = 1
+            self._local.data = self._load_copy()
+            self._local.dirty = False
+            try:
+                yield self
+                if self._local.dirty:
+                    self._save(self._local.data)
+            finally:
+                self._local.depth = 0
+                self._local.data = None
+
+    def _write(self, mutate):
+        if getattr(self._local, 'depth', 0):
+            mutate(self._local.data)
+            self._local.dirty = True
+        else:
+            with self.transaction():
+                mutate(self._local.data)
+                self._local.dirty = True
+
+    def get(self, key, default=None):
+        record = self._data().get(key) if key != SCHEMA_KEY else None
+        return dict(record) if record is not None else default
+
+    def list_dir(self, dir_key):
+        # json 后端没有持久化的目录索引，按目录过滤一遍
+        result = {}
+        for key, record in self._data().items():
+            if key != SCHEMA_KEY and split_key(key)[0] == dir_key:
+                result[split_key(key)[1]] = dict(record)
+        return result
+
+    def list_prefix(self, prefix):
+        # 子树下的全部记录 [(key, 记录)]
+        return [(k, dict(v)) for k, v in self._data().items() if _in_subtree(k, prefix)]
+
+    def put(self, key, record):
+        def mutate(data):
+            data[key] = dict(record)
+        self._write(mutate)
+
+    def delete(self, key):
+        def mutate(data):
+            data.pop(key, None)
+        self._write(mutate)
+
+    def move_prefix(self, old_prefix, new_prefix):
+        # 文件夹移动/重命名时整体改写子树下所有记录的 key
+        def mutate(data):
+            moved = [k for k in data if _in_subtree(k, old_prefix)]
+            for key in moved:
+                data[new_prefix + key[len(old_prefix):]] = data.pop(key)
+        self._write(mutate)
+
+    def delete_prefix(self, prefix):
+        def mutate(data):
+            for key in [k for k in data if _in_subtree(k, prefix)]:
+                del data[key]
+        self._write(mutate)
+
+    def get_schema_version(self):
+        return self._data().get(SCHEMA_KEY, {}).get('version', 1)
+
+    def set_schema_version(self, version):
+        def mutate(data):
+            data[SCHEMA_KEY] = {'version': version}
+        self._write(mutate)
+
+    def items(self):
+        return [(k, dict(v)) for k, v in self._data().items() if k != SCHEMA_KEY]
+
+    def close(self):
+        pass
+
+
+class SqliteMetadataStore(SqliteMixin):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # 累计解析过的 extra 列 JSON 字节数 (指标)
+        self.bytes_parsed = 0
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            ' name TEXT PRIMARY KEY,'
+            ' dir TEXT,'
+            ' original_name TEXT,'
+            ' upload_time TEXT,'
+            ' edit_time TEXT,'
+            ' owner TEXT,'
+            ' extra TEXT)'
+        )
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(metadata)')]
+        if 'dir' not in columns:
+            # 版本 1 的表没有 dir 列
+            conn.execute('ALTER TABLE metadata ADD COLUMN dir TEXT')
+            names = [row[0] for row in conn.execute('SELECT name FROM metadata')]
+            conn.executemany('UPDATE metadata SET dir = ? WHERE name = ?',
+                             [(split_key(name)[0], name) for name in names])
+        conn.execute('CREATE INDEX IF NOT EXISTS metadata_dir ON metadata (dir)')
+
+    def warm(self):
+        self._connect()
+
+
+    _SELECT = 'SELECT ' + ', '.join(COLUMNS) + ' FROM metadata'
+    _INSERT = ('INSERT OR REPLACE INTO metadata (' + ', '.join(COLUMNS) + ') VALUES ('
+               + ', '.join('?' * len(COLUMNS)) + ')')
+
+    def _to_record(self, row):
+        record = {field: row[i + 2] for i, field in enumerate(FIELDS) if row[i + 2] is not None}
+        if row[-1]:
+            self.bytes_parsed += len(row[-1])
+            record.update(json.loads(row[-1]))
+        return record
+
+    @staticmethod
+    def _to_row(key, record):
+        extra = {k: v for k, v in record.items() if k not in FIELDS}
+        return (key, split_key(key)[0]) + tuple(record.get(f) for f in FIELDS) + (
+            json.dumps(extra, ensure_ascii=False) if extra else None,)
+
+    def get(self, key, default=None):
+        row = self._connect().execute(
+            self._SELECT + ' WHERE name = ?', (key,)).fetchone()
+        return self._to_record(row) if row else default
+
+    def list_dir(self, dir_key):
+        # 走 dir 索引，一次查询取出某个目录下的全部记录，返回 {文件名: 记录}
+        rows = self._connect().execute(self._SELECT + ' WHERE dir = ?', (dir_key,))
+        return {split_key(row[0])[1]: self._to_record(row) for row in rows}
+
+    def list_prefix(self, prefix):
+        rows = self._connect().execute(
+            self._SELECT + " WHERE name >= :p || '/' AND name < :p || '0'", {'p': prefix})
+        return [(row[0], self._to_record(row)) for row in rows]
+
+    def put(self, key, record):
+        self._connect().execute(self._INSERT, self._to_row(key, record))
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM metadata WHERE name = ?', (key,))
+
+    def move_prefix(self, old_prefix, new_prefix):
+        # 'a/' <= name < 'a0' 正好是 a/ 下的整棵子树，可以走主键索引; 一条语句批量改写
+        n = len(old_prefix) + 1
+        self._connect().execute(
+            'UPDATE OR REPLACE metadata SET'
+            ' name = :new || substr(name, :n),'
+            ' dir = CASE WHEN dir = :old THEN :new ELSE :new || substr(dir, :n) END'
+            " WHERE name >= :old || '/' AND name < :old || '0'",
+            {'old': old_prefix, 'new': new_prefix, 'n': n})
+
+    def delete_prefix(self, prefix):
+        self._connect().execute(
+            "DELETE FROM metadata WHERE name >= :p || '/' AND name < :p || '0'", {'p': prefix})
+
+    def get_schema_version(self):
+        version = self._connect().execute('PRAGMA user_version').fetchone()[0]
+        return version or 1
+
+    def set_schema_version(self, version):
+        self._connect().execute(f'PRAGMA user_version = {int(version)}')
+
+    def items(self):
+        rows = self._connect().execute(self._SELECT + ' ORDER BY name')
+        return [(row[0], self._to_record(row)) for row in rows]
+
+
+
+def migrate_json(json_path, store):
+    # 一次性把旧的 metadata.json 导入到新的存储后端
+    if not os.path.exists(json_path):
+        return 0
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    version = data.pop(SCHEMA_KEY, {}).get('version', 1)
+    with store.transaction():
+        for key, record in data.items():
+            store.put(key, record)
+        store.set_schema_version(version)
+    return len(data)
+
+
+def migrate_to_paths(store, upload_folder):
+    # 版本 1 -> 2: 以文件名为 key 的旧记录改为以相对路径为 key
+    # 同名文件出现在多个目录时，每个目录都会得到一份旧记录的副本
+    if store.get_schema_version() >= SCHEMA_VERSION:
+        return 0
+    old_records = dict(store.items())
+    moved_names = set()
+    with store.transaction():
+        for root, dirs, files in os.walk(upload_folder):
+            rel_dir = make_key(os.path.relpath(root, upload_folder))
+            for name in files:
+                key = make_key(rel_dir, name)
+                if key != name and name in old_records and key not in old_records:
+                    store.put(key, old_records[name])
+                    moved_names.add(name)
+        # 找不到对应文件的旧记录保持原样，不做删除
+        for name in moved_names:
+            if not os.path.isfile(os.path.join(upload_folder, name)):
+                store.delete(name)
+        store.set_schema_version(SCHEMA_VERSION)
+    return len(moved_names)
+
+
+def open_store(backend, json_path, db_path):
+    if backend == 'json':
+        return JsonMetadataStore(json_path)
+    if backend == 'sqlite':
+        need_migrate = not os.path.exists(db_path)
+        store = SqliteMetadataStore(db_path)
+        if need_migrate:
+            migrate_json(json_path, store)
+        return store
+    raise ValueError(f"未知的元数据后端: {backend}")
@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+# 进程内的指标: 计数器、耗时直方图，按 Prometheus 文本格式导出
+# - inc / observe 随时调用；有状态的对象 (渲染缓存、元数据存储) 通过 collector 在导出时读取自身计数
+# - phase(name) 记录一段代码的耗时，同时记到当前请求的分段列表里 (用于 Server-Timing 头)
+# - 多 worker 部署时每个进程各自统计，由 Prometheus 分别抓取
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_request_phases = contextvars.ContextVar('request_phases', default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def add_collector(self, func):
+        # func() 返回 [(指标名, {标签}, 值)]，导出时调用
+        self._collectors.append(func)
+
+    def value(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        with self._lock:
+            samples = {}
+            for (name, labels), value in self._counters.items():
+                samples.setdefault(name, []).append((labels, value))
+            histograms = {key: list(hist) for key, hist in self._histograms.items()}
+        for func in self._collectors:
+            for name, labels, value in func():
+                samples.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+
+        lines = []
+        for name in sorted(samples):
+            kind, help_text = self._meta.get(name, ('untyped', ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(samples[name]):
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        by_name = {}
+        for (name, labels), hist in histograms.items():
+            by_name.setdefault(name, []).append((labels, hist))
+        for name in sorted(by_name):
+            kind, help_text = self._meta.get(name, ('histogram', ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, hist in sorted(by_name[name]):
+                for i, bound in enumerate(BUCKETS):
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {hist[i]}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {hist[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {hist[-2]:.6f}')
+                lines.append(f'{name}_count{_format_labels(labels)} {hist[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REGISTRY.describe('files_scanned_total', 'counter', '目录列表扫描过的条目数')
+REGISTRY.describe('metadata_bytes_parsed_total', 'counter', '解析过的元数据字节数')
+REGISTRY.describe('render_cache_hits_total', 'counter', '渲染缓存命中次数')
+REGISTRY.describe('render_cache_misses_total', 'counter', '渲染缓存未命中次数')
+REGISTRY.describe('code_highlight_cache_hits_total', 'counter', '代码块高亮缓存命中次数')
+REGISTRY.describe('code_highlight_cache_misses_total', 'counter', '代码块高亮缓存未命中次数')
+REGISTRY.describe('preview_block_cache_hits_total', 'counter', '实时预览块缓存命中次数')
+REGISTRY.describe('preview_block_cache_misses_total', 'counter', '实时预览块缓存未命中次数')
+REGISTRY.describe('zip_bytes_streamed_total', 'counter', '打包下载/导出产出的 zip 字节数')
+REGISTRY.describe('request_duration_seconds', 'histogram', '请求处理耗时 (不含流式响应体的发送)')
+REGISTRY.describe('phase_duration_seconds', 'histogram', '请求内各阶段耗时')
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def begin_request():
+    phases = []
+    _request_phases.set(phases)
+    return phases
+
+
+def end_request():
+    _request_phases.set(None)
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe('phase_duration_seconds', elapsed, phase=name)
+        phases = _request_phases.get()
+        if phases is not None:
+            phases.append((name, elapsed))
+
+
+def server_timing(phases, total):
+    # Server-Timing: scan;dur=1.20, render;dur=3.40, total;dur=9.10 (毫秒)
+    parts = [f'{name};dur={elapsed * 1000:.2f}' for name, elapsed in phases]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class SlowRequestProfiler:
+    # 采样分析器: 后台线程每 interval 秒采一次正在处理请求的线程栈，
+    # 请求耗时超过 threshold 秒时把采样结果以 collapsed 格式写到 out_dir (可直接交给 flamegraph.pl / speedscope)
+
+    def __init__(self, threshold, interval, out_dir):
+        self.threshold = threshold
+        self.interval = interval
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._active = {}
+        os.makedirs(out_dir, exist_ok=True)
+        thread = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+        thread.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def end(self, elapsed, label):
+        # 返回写出的文件路径；请求不慢或没有采到样本时返回 None
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or elapsed < self.threshold:
+            return None
+        safe_label = ''.join(c if c.isalnum() or c in '-_' else '_' for c in label)
+        path = os.path.join(self.out_dir, f'{int(time.time() * 1000)}-{safe_label}-{int(elapsed * 1000)}ms.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
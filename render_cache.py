@@ -0,0 +1,121 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 渲染后的 HTML 缓存
+# - 内存: 以 (相对路径, mtime_ns, size) 判断是否过期，按字节预算做 LRU 淘汰
+# - 磁盘(可选): 以 (渲染管线配置, 内容) 的 sha256 为 key，重启后不必全部重新渲染
+# 实际渲染交给 markdown_pipeline.MarkdownPipeline
+
+
+class RenderCache:
+    def __init__(self, pipeline, max_bytes, persist_dir=None, max_disk_bytes=None):
+        self.pipeline = pipeline
+        self.max_bytes = max_bytes
+        self.persist_dir = persist_dir
+        self.max_disk_bytes = max_disk_bytes or max_bytes * 4
+        self._lock = threading.Lock()
+        # key -> (stamp, html, 字节数)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+        if persist_dir and not os.path.exists(persist_dir):
+            os.makedirs(persist_dir)
+
+    def render_file(self, key, full_path):
+        # 返回 (原文, html)；原文总是从磁盘读取，命中缓存时跳过 markdown 渲染
+        st = os.stat(full_path)
+        with open(full_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return content, entry[1]
+            self.misses += 1
+
+        html = self._load_disk(content)
+        if html is None:
+            html = self.pipeline.render(content)
+            self._save_disk(content, html)
+        self._put(key, stamp, html)
+        return content, html
+
+    def _put(self, key, stamp, html):
+        nbytes = len(html.encode('utf-8'))
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+            self._entries[key] = (stamp, html, nbytes)
+            self._size += nbytes
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted[2]
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+
+    def invalidate_prefix(self, prefix):
+        # 文件夹被移动/重命名时，清掉该子树下的全部条目
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix + '/')]:
+                self._size -= self._entries.pop(key)[2]
+
+    def _disk_path(self, content):
+        digest = hashlib.sha256(f"{self.pipeline.signature}\0{content}".encode('utf-8')).hexdigest()
+        return os.path.join(self.persist_dir, digest[:2], digest + '.html')
+
+    def _load_disk(self, content):
+        if not self.persist_dir:
+            return None
+        try:
+            with open(self._disk_path(content), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _save_disk(self, content, html):
+        if not self.persist_dir:
+            return
+        path = self._disk_path(content)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+        self._disk_writes += 1
+        if self._disk_writes % 64 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # 磁盘缓存超出上限时删除最久未写入的文件
+        entries = []
+        for root, dirs, files in os.walk(self.persist_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
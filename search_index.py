@@ -0,0 +1,203 @@
+import os
+import re
+import html
+import hashlib
+import sqlite3
+import threading
+from functools import lru_cache
+
+from sqlite_util import SqliteMixin
+
+# 笔记全文索引 (SQLite FTS5)
+# - 拉丁文字交给 unicode61 分词器；中日韩文字在入库前按单字切开，
+#   查询时把连续的汉字作为短语匹配，效果等同于子串匹配
+# - docs 表保存 路径 -> FTS rowid 的映射，文件夹移动只需改 docs 里的路径
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+# 大字符区间的正则编译要十几毫秒，第一次用到 (或 warm()) 时才编译
+@lru_cache(maxsize=None)
+def _cjk_char():
+    return re.compile(f'([{_CJK}])')
+
+
+@lru_cache(maxsize=None)
+def _cjk_space():
+    # 去掉切分汉字时插入的空格 (高亮标记 \x02 / \x03 视为透明)
+    return re.compile(f'(?:(?<=[{_CJK}])|(?<=[{_CJK}][\x02\x03])) +| +(?=[\x02\x03]?[{_CJK}])')
+
+
+def warm():
+    _cjk_char()
+    _cjk_space()
+
+
+def segment(text):
+    return _cjk_char().sub(r' \1 ', text)
+
+
+def build_query(keyword):
+    # 每个以空白分隔的词作为一个短语，多个词之间为 AND
+    phrases = []
+    for term in keyword.split():
+        tokens = segment(term).split()
+        if tokens:
+            phrases.append('"' + ' '.join(tokens).replace('"', '""') + '"')
+    return ' '.join(phrases)
+
+
+def format_snippet(raw):
+    text = html.escape(_cjk_space().sub('', raw))
+    return text.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+def content_hash(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class SearchIndex(SqliteMixin):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS docs ('
+            ' id INTEGER PRIMARY KEY,'
+            ' path TEXT UNIQUE,'
+            ' title TEXT,'
+            ' owner TEXT,'
+            ' hash TEXT)'
+        )
+        conn.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5('
+            " title, body, tokenize = 'unicode61')"
+        )
+
+
+    def index_note(self, key, title, owner, content):
+        digest = content_hash(content)
+        with self.transaction():
+            conn = self._connect()
+            row = conn.execute('SELECT id, title, owner, hash FROM docs WHERE path = ?', (key,)).fetchone()
+            if row and tuple(row[1:]) == (title, owner, digest):
+                return False
+            if row:
+                doc_id = row[0]
+                conn.execute('UPDATE docs SET title = ?, owner = ?, hash = ? WHERE id = ?',
+                             (title, owner, digest, doc_id))
+                conn.execute('DELETE FROM notes_fts WHERE rowid = ?', (doc_id,))
+            else:
+                doc_id = conn.execute('INSERT INTO docs (path, title, owner, hash) VALUES (?, ?, ?, ?)',
+                                      (key, title, owner, digest)).lastrowid
+            conn.execute('INSERT INTO notes_fts (rowid, title, body) VALUES (?, ?, ?)',
+                         (doc_id, segment(title), segment(content)))
+        return True
+
+    def index_file(self, key, full_path, title, owner):
+        with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        return self.index_note(key, title, owner, content)
+
+    def move(self, old_key, new_key):
+        # 目标已有文档时先连同 FTS 行一起删掉 (UPDATE OR REPLACE 只会删 docs 行，留下孤立的 FTS 行)；
+        # 源不存在时什么都不做，不会误删目标
+        with self.transaction():
+            conn = self._connect()
+            if old_key == new_key or not conn.execute('SELECT 1 FROM docs WHERE path = ?', (old_key,)).fetchone():
+                return
+            self.remove(new_key)
+            conn.execute('UPDATE docs SET path = ? WHERE path = ?', (new_key, old_key))
+
+    def remove(self, key):
+        with self.transaction():
+            conn = self._connect()
+            row = conn.execute('SELECT id FROM docs WHERE path = ?', (key,)).fetchone()
+            if row:
+                conn.execute('DELETE FROM notes_fts WHERE rowid = ?', (row[0],))
+                conn.execute('DELETE FROM docs WHERE id = ?', (row[0],))
+
+    def remove_prefix(self, prefix):
+        with self.transaction():
+            conn = self._connect()
+            where = "path >= :p || '/' AND path < :p || '0'"
+            conn.execute(f'DELETE FROM notes_fts WHERE rowid IN (SELECT id FROM docs WHERE {where})', {'p': prefix})
+            conn.execute(f'DELETE FROM docs WHERE {where}', {'p': prefix})
+
+    def move_prefix(self, old_prefix, new_prefix):
+        # 只删除会被源文档替换的目标文档 (docs + FTS)，再整体改路径
+        if old_prefix == new_prefix:
+            return
+        params = {'old': old_prefix, 'new': new_prefix, 'n': len(old_prefix) + 1}
+        where = "path >= :old || '/' AND path < :old || '0'"
+        replaced = f"SELECT id FROM docs WHERE path IN (SELECT :new || substr(path, :n) FROM docs WHERE {where})"
+        with self.transaction():
+            conn = self._connect()
+            conn.execute(f'DELETE FROM notes_fts WHERE rowid IN ({replaced})', params)
+            conn.execute(f'DELETE FROM docs WHERE id IN ({replaced})', params)
+            conn.execute(f'UPDATE docs SET path = :new || substr(path, :n) WHERE {where}', params)
+
+    def paths(self):
+        return {row[0]: row[1] for row in self._connect().execute('SELECT path, hash FROM docs')}
+
+    def search(self, keyword, auth_user='', page=1, per_page=20):
+        # 返回 (总数, 当前页结果)；个人文件只对其所有者可见
+        query = build_query(keyword)
+        if not query:
+            return 0, []
+        conn = self._connect()
+        where = "notes_fts MATCH :q AND (d.owner = 'shared' OR d.owner = :user)"
+        params = {'q': query, 'user': auth_user or None,
+                  'limit': per_page, 'offset': (page - 1) * per_page}
+        try:
+            total = conn.execute(
+                f'SELECT COUNT(*) FROM notes_fts JOIN docs d ON d.id = notes_fts.rowid WHERE {where}',
+                params).fetchone()[0]
+            rows = conn.execute(
+                'SELECT d.path, d.title, d.owner,'
+                f" snippet(notes_fts, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 24),"
+                ' bm25(notes_fts, 10.0, 1.0) AS rank'
+                f' FROM notes_fts JOIN docs d ON d.id = notes_fts.rowid WHERE {where}'
+                ' ORDER BY rank LIMIT :limit OFFSET :offset',
+                params).fetchall()
+        except sqlite3.OperationalError:
+            # 查询语法无法解析时按无结果处理
+            return 0, []
+        results = []
+        for path, title, owner, snippet, rank in rows:
+            results.append({
+                'path': path,
+                'dir': path.rpartition('/')[0],
+                'name': path.rpartition('/')[2],
+                'title': title,
+                'owner': owner,
+                'snippet': format_snippet(snippet),
+                'score': -rank,
+            })
+        return total, results
+
+
+def rebuild(index, store, upload_folder):
+    # 全量重建: 内容未变化的笔记跳过，磁盘上已不存在的笔记从索引删除
+    seen = set()
+    updated = 0
+    with index.transaction():
+        for root, dirs, files in os.walk(upload_folder):
+            rel_dir = os.path.relpath(root, upload_folder).replace('\\', '/')
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            records = store.list_dir(rel_dir)
+            for name in files:
+                if not name.lower().endswith('.md'):
+                    continue
+                key = f"{rel_dir}/{name}" if rel_dir else name
+                meta = records.get(name, {})
+                seen.add(key)
+                if index.index_file(key, os.path.join(root, name),
+                                    meta.get('original_name', name), meta.get('owner', 'shared')):
+                    updated += 1
+        removed = [key for key in index.paths() if key not in seen]
+        for key in removed:
+            index.remove(key)
+    return updated, len(removed)
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+# SQLite 存储的公共部分 (元数据、全文索引、版本历史、任务队列)
+# - 每个线程一个连接，WAL 模式；isolation_level=None: 由我们自己控制 BEGIN / COMMIT
+# - transaction() 可嵌套，只有最外层执行 BEGIN IMMEDIATE / COMMIT
+# - fork 出来的子进程不沿用父进程的连接，第一次使用时重新打开
+# 使用方在 __init__ 里设置 self.path 和 self._local = threading.local()
+
+BUSY_TIMEOUT = 30
+
+
+class SqliteMixin:
+    row_factory = None
+
+    def _connect(self):
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            local.conn = conn
+            local.pid = os.getpid()
+            local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._connect()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield self
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = 1
+        try:
+            yield self
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+        finally:
+            self._local.depth = 0
+
+    def close(self):
+        # 只关闭当前线程的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from file_lock import FileLock
+from listing import scan_directory
+from metadata_store import make_key
+from markdown_pipeline import MarkdownPipeline
+
+# 静态站点导出: 把全部共享笔记和目录列表渲染成静态 HTML，可由 nginx 等直接提供
+# - 输出: <out>/<目录>/index.html 为目录页，<out>/<目录>/<文件名>.html 为笔记页，样式在 <out>/_static/，
+#   页面之间全部用相对链接
+# - 增量: .manifest.json 记录每篇笔记的 edit_time、文件 (mtime_ns, size)、内容 sha256 和每个目录页的条目指纹；
+#   edit_time / 标题变化的笔记重新渲染，只有文件 stat 变化的笔记比对内容哈希后再决定，
+#   目录页只在条目变化时重写，渲染配置或模板变化时全部重建
+# - 笔记按批交给进程池渲染，每个进程各自加载一份渲染管线和模板
+# - 个人笔记不导出
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+TEMPLATES = ('export_index.html', 'export_note.html')
+MANIFEST = '.manifest.json'
+# 每个进程池任务渲染的笔记数，减少进程间通信的次数
+BATCH_SIZE = 16
+
+
+def _format_timestamp(ts):
+    if not ts:
+        return ''
+    return datetime.fromtimestamp(int(ts)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class _Renderer:
+    # 每个进程一个: 加载好扩展的渲染管线 + 编译好的模板
+    def __init__(self, extensions, code_style, template_dir):
+        self.pipeline = MarkdownPipeline(extensions, code_style)
+        env = Environment(loader=FileSystemLoader(template_dir), autoescape=select_autoescape(['html']))
+        env.filters['timestamp'] = _format_timestamp
+        self.index_template = env.get_template('export_index.html')
+        self.note_template = env.get_template('export_note.html')
+
+    def render_note(self, task):
+        # task: (key, 源文件, 输出文件, 上次的内容哈希, 页面参数)
+        # 上次的哈希为 None 表示必须重建；否则内容哈希未变时跳过渲染
+        key, src, dest, old_hash, context = task
+        with open(src, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == old_hash:
+            return key, digest, False
+        html = self.pipeline.render(data.decode('utf-8'))
+        _write(dest, self.note_template.render(html=html, **context))
+        return key, digest, True
+
+
+_renderer = None
+
+
+def _init_worker(extensions, code_style, template_dir):
+    global _renderer
+    _renderer = _Renderer(extensions, code_style, template_dir)
+
+
+def _render_batch(tasks):
+    return [_renderer.render_note(task) for task in tasks]
+
+
+def _run_tasks(tasks, renderer, workers, extensions, code_style, template_dir):
+    batches = [tasks[i:i + BATCH_SIZE] for i in range(0, len(tasks), BATCH_SIZE)]
+    if workers <= 1 or len(batches) <= 1:
+        return [renderer.render_note(task) for task in tasks]
+    # spawn: 调用方 (flask CLI) 可能已经起了后台线程，fork 出来的子进程可能继承到被占用的锁
+    with ProcessPoolExecutor(min(workers, len(batches)), mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(extensions, code_style, template_dir)) as pool:
+        results = []
+        for batch in pool.map(_render_batch, batches):
+            results.extend(batch)
+        return results
+
+
+def _signature(pipeline, template_dir):
+    h = hashlib.sha1(pipeline.signature.encode('utf-8'))
+    for name in TEMPLATES:
+        with open(os.path.join(template_dir, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def export_site(store, upload_folder, out_dir, extensions, code_style='default', workers=None,
+                template_dir=TEMPLATE_DIR, static_dir=STATIC_DIR):
+    # 返回统计: notes / notes_rendered / dirs / dirs_rendered / removed / seconds
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    with FileLock(os.path.join(out_dir, '.lock')):
+        renderer = _Renderer(extensions, code_style, template_dir)
+        signature = _signature(renderer.pipeline, template_dir)
+        manifest = _load_manifest(out_dir)
+        fresh = manifest.get('signature') == signature
+        old_notes = manifest.get('notes', {})
+        old_dirs = manifest.get('dirs', {})
+        notes = {}
+        dirs = {}
+        tasks = []
+        stats = {'notes': 0, 'notes_rendered': 0, 'dirs': 0, 'dirs_rendered': 0, 'removed': 0}
+
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            browse_path = os.path.join(upload_folder, rel_dir) if rel_dir else upload_folder
+            folders, files = scan_directory(browse_path, store.list_dir(rel_dir))
+            folders.sort()
+            shared = sorted((f for f in files if f['owner'] == 'shared'),
+                            key=lambda f: (f['original_name'].lower(), f['name']))
+            root = '../' * (rel_dir.count('/') + 1) if rel_dir else ''
+
+            for f in shared:
+                key = make_key(rel_dir, f['name'])
+                src = os.path.join(browse_path, f['name'])
+                try:
+                    st = os.stat(src)
+                except FileNotFoundError:
+                    continue
+                entry = {'edit_time': f['edit_time'], 'title': f['original_name'],
+                         'stamp': [st.st_mtime_ns, st.st_size], 'sha256': None}
+                notes[key] = entry
+                dest = os.path.join(out_dir, key + '.html')
+                old = old_notes.get(key) if fresh else None
+                old_hash = None
+                if (old and old['edit_time'] == entry['edit_time'] and old['title'] == entry['title']
+                        and os.path.exists(dest)):
+                    entry['sha256'] = old['sha256']
+                    if old['stamp'] == entry['stamp']:
+                        continue
+                    old_hash = old['sha256']
+                tasks.append((key, src, dest, old_hash, {'title': f['original_name'], 'edit_time': f['edit_time'],
+                                                          'current_dir': rel_dir, 'root': root}))
+
+            listing = json.dumps([folders, [[f['name'], f['original_name'], f['upload_time'], f['edit_time']]
+                                            for f in shared]], ensure_ascii=False)
+            dirs[rel_dir] = hashlib.sha1(listing.encode('utf-8')).hexdigest()
+            index_path = os.path.join(out_dir, rel_dir, 'index.html')
+            if not fresh or old_dirs.get(rel_dir) != dirs[rel_dir] or not os.path.exists(index_path):
+                _write(index_path, renderer.index_template.render(current_dir=rel_dir, root=root,
+                                                                  folders=folders, files=shared))
+                stats['dirs_rendered'] += 1
+            pending.extend(make_key(rel_dir, name) for name in folders)
+
+        for key, digest, rendered in _run_tasks(tasks, renderer, workers, extensions, code_style, template_dir):
+            notes[key]['sha256'] = digest
+            if rendered:
+                stats['notes_rendered'] += 1
+
+        # 已删除的笔记和目录: 删掉对应页面，再由深到浅清理空目录
+        for key in old_notes.keys() - notes.keys():
+            stats['removed'] += _remove(os.path.join(out_dir, key + '.html'))
+        for rel_dir in sorted(old_dirs.keys() - dirs.keys(), key=lambda d: d.count('/'), reverse=True):
+            stats['removed'] += _remove(os.path.join(out_dir, rel_dir, 'index.html'))
+            try:
+                os.rmdir(os.path.join(out_dir, rel_dir))
+            except OSError:
+                pass
+
+        os.makedirs(os.path.join(out_dir, '_static'), exist_ok=True)
+        shutil.copyfile(os.path.join(static_dir, 'style.css'), os.path.join(out_dir, '_static', 'style.css'))
+        _write(os.path.join(out_dir, '_static', 'highlight.css'), renderer.pipeline.css())
+        _write(os.path.join(out_dir, MANIFEST),
+               json.dumps({'signature': signature, 'notes': notes, 'dirs': dirs}, ensure_ascii=False))
+
+    stats['notes'] = len(notes)
+    stats['dirs'] = len(dirs)
+    stats['seconds'] = time.perf_counter() - start
+    return stats
@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app 在导入时读取配置，数据目录必须在导入前指到临时目录
+os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='notes-test-')
+os.environ.setdefault('LAZY_START', '1')
+
+import app as notes_app
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    notes_app.create_app()
+    return notes_app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def wait_job(app_module):
+    def wait(job_id, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = app_module.job_queue.get(job_id)
+            if job['status'] not in ('queued', 'running'):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"任务 {job_id} 超时")
+    return wait
@@ -0,0 +1,40 @@
+from history import VersionHistory
+
+
+def make_history(tmp_path):
+    history = VersionHistory(str(tmp_path / 'history.db'))
+    history.record('a/n1.md', 'v1')
+    history.record('a/n1.md', 'v2')
+    history.record('b/a/n1.md', 'dest')
+    history.record('b/a/n2.md', 'other')
+    return history
+
+
+def test_move_prefix_keeps_destination_without_source(tmp_path):
+    history = make_history(tmp_path)
+    history.move_prefix('missing', 'b/a')
+    assert len(history.revisions('b/a/n1.md')) == 1
+    assert len(history.revisions('b/a/n2.md')) == 1
+
+
+def test_move_prefix_replaces_only_overlapping_paths(tmp_path):
+    history = make_history(tmp_path)
+    history.move_prefix('a', 'b/a')
+    assert history.get('b/a/n1.md') == 'v2'
+    assert len(history.revisions('b/a/n1.md')) == 2
+    assert history.get('b/a/n2.md') == 'other'
+    assert history.revisions('a/n1.md') == []
+
+
+def test_move_without_source_keeps_destination(tmp_path):
+    history = make_history(tmp_path)
+    history.move('missing.md', 'b/a/n1.md')
+    assert history.get('b/a/n1.md') == 'dest'
+    history.move('a/n1.md', 'b/a/n1.md')
+    assert history.get('b/a/n1.md') == 'v2'
+
+
+def test_latest_rev(tmp_path):
+    history = make_history(tmp_path)
+    assert history.latest_rev('a/n1.md') == 2
+    assert history.latest_rev('missing.md') is None
@@ -0,0 +1,30 @@
+import os
+import time
+
+
+def test_last_modified_follows_external_edits(client, app_module):
+    client.post('/create_new_file', data={'dir': '', 'new_filename': 'lm_ext', 'content': 'a'})
+    path = os.path.join(app_module.UPLOAD_FOLDER, 'lm_ext.md')
+    before = client.get('/raw/lm_ext.md').headers['Last-Modified']
+
+    # 应用外的修改: 内容和 mtime 变了，edit_time 没变
+    later = time.time() + 120
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('b')
+    os.utime(path, (later, later))
+    response = client.get('/raw/lm_ext.md', headers={'If-Modified-Since': before})
+    assert response.status_code == 200
+    assert response.headers['Last-Modified'] != before
+
+
+def test_last_modified_does_not_go_back_with_reused_blob(client):
+    client.post('/create_new_file', data={'dir': '', 'new_filename': 'lm_keep', 'content': 'XXX'})
+    client.post('/create_new_file', data={'dir': '', 'new_filename': 'lm_note', 'content': 'XXX'})
+    time.sleep(1.1)
+    client.post('/update_file', data={'dir': '', 'filename': 'lm_note.md', 'content': 'YYY'})
+    modified_y = client.get('/raw/lm_note.md').headers['Last-Modified']
+    time.sleep(1.1)
+    # 改回 X: 重新链接到 lm_keep 仍在引用的旧 blob，其 mtime 更早
+    client.post('/update_file', data={'dir': '', 'filename': 'lm_note.md', 'content': 'XXX'})
+    response = client.get('/raw/lm_note.md', headers={'If-Modified-Since': modified_y})
+    assert response.status_code == 200
@@ -0,0 +1,47 @@
+import os
+import time
+
+import pytest
+
+from jobs import JobCancelled
+
+
+class CancelledExport:
+    id = 'cancelled-export'
+    done = 0
+
+    def __init__(self, params):
+        self.params = params
+
+    def set_total(self, total):
+        pass
+
+    def cancelled(self):
+        return True
+
+    def checkpoint(self, message=None, **state):
+        pass
+
+
+def test_cancelled_export_removes_tmp_file(client, app_module):
+    client.post('/create_new_file', data={'dir': '', 'new_filename': 'ex1', 'content': 'x'})
+    with pytest.raises(JobCancelled):
+        app_module.run_export_job(CancelledExport({'dir': '', 'items': ['ex1.md']}))
+    assert not os.path.exists(os.path.join(app_module.JOB_OUTPUT_FOLDER, 'cancelled-export.zip.tmp'))
+
+
+def test_expired_jobs_and_outputs_are_purged(client, app_module, wait_job):
+    client.post('/create_new_file', data={'dir': '', 'new_filename': 'ex2', 'content': 'x'})
+    job_id = client.post('/jobs/export', data={'dir': '', 'selected_files': ['ex2.md']}).get_json()['job_id']
+    assert wait_job(job_id)['status'] == 'done'
+    output = os.path.join(app_module.JOB_OUTPUT_FOLDER, f'{job_id}.zip')
+    assert os.path.exists(output)
+
+    expired = time.time() - app_module.JOB_RETENTION_DAYS * 86400 - 60
+    os.utime(output, (expired, expired))
+    app_module.job_queue._connect().execute('UPDATE jobs SET updated = ? WHERE id = ?', (int(expired), job_id))
+
+    next_id = client.post('/jobs/export', data={'dir': '', 'selected_files': ['ex2.md']}).get_json()['job_id']
+    assert app_module.job_queue.get(job_id) is None
+    assert not os.path.exists(output)
+    assert wait_job(next_id)['status'] == 'done'
@@ -0,0 +1,37 @@
+import re
+
+import pytest
+
+from markdown_pipeline import MarkdownPipeline, split_blocks
+
+DOCS = {
+    'ordered_list': '1. first\n\n2. second\n\n3. third',
+    'loose_list': '- a\n\n    continued\n\n- b\n\n1. c\n\npara',
+    'nested_list': '- a\n\n    - b\n\n    - c\n\n- d',
+    'paragraph_list': 'para\n\n- a\n\n- b\n\ntext',
+    'table': 'Intro\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\nafter',
+    'fence': '# T\n\n```python\nx = 1\n\ny = 2\n```\n\n- item\n\n```\nplain\n```',
+    'toc': '[TOC]\n\n# A\n\n## B\n\ntext',
+}
+
+
+@pytest.fixture(scope='module')
+def pipeline():
+    return MarkdownPipeline(['tables', 'fenced_code', 'codehilite', 'toc'])
+
+
+def normalize(html):
+    # 块之间的空行不影响显示
+    return re.sub(r'>\s+<', '><', html.strip())
+
+
+@pytest.mark.parametrize('name', sorted(DOCS))
+def test_render_blocks_matches_render(pipeline, name):
+    text = DOCS[name]
+    joined = '\n'.join(block['html'] for block in pipeline.render_blocks(text))
+    assert normalize(joined) == normalize(pipeline.render(text))
+
+
+def test_list_items_stay_in_one_block():
+    blocks, _ = split_blocks('1. first\n\n2. second\n\npara\n\n- a')
+    assert blocks == ['1. first\n\n2. second', 'para', '- a']
@@ -0,0 +1,65 @@
+import os
+from urllib.parse import urlparse, parse_qs
+
+
+def submit(client, data):
+    response = client.post('/move_selected', data=data)
+    assert response.status_code == 302
+    return parse_qs(urlparse(response.headers['Location']).query).get('job', [None])[0]
+
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return [message for _, message in session.pop('_flashes', [])]
+
+
+def test_repeated_folder_move_keeps_history(client, app_module, wait_job):
+    client.post('/mkdir', data={'dir': '', 'folder_name': 'rm_a'})
+    client.post('/mkdir', data={'dir': '', 'folder_name': 'rm_b'})
+    client.post('/create_new_file', data={'dir': 'rm_a', 'new_filename': 'n1', 'content': 'v1'})
+    client.post('/update_file', data={'dir': 'rm_a', 'filename': 'n1.md', 'content': 'v2'})
+    data = {'dir': '', 'selected_files': ['rm_a'], 'target_dir': 'rm_b'}
+
+    assert wait_job(submit(client, data))['status'] == 'done'
+    assert len(app_module.version_history.revisions('rm_b/rm_a/n1.md')) == 2
+
+    # 重复提交: 源已不存在 (按单个条目同步执行)，不能被当成续跑
+    assert submit(client, data) is None
+    assert flashes(client)[-1] == "'rm_a' 不存在，无法移动。"
+    assert len(app_module.version_history.revisions('rm_b/rm_a/n1.md')) == 2
+    assert app_module.metadata_store.get('rm_b/rm_a/n1.md')['owner'] == 'shared'
+
+
+def test_repeated_file_move_keeps_destination(client, app_module):
+    client.post('/mkdir', data={'dir': '', 'folder_name': 'rf_b'})
+    client.post('/create_new_file', data={'dir': '', 'new_filename': 'rf1', 'content': 'walrus'})
+    data = {'dir': '', 'selected_files': ['rf1.md'], 'target_dir': 'rf_b'}
+
+    assert submit(client, data) is None
+    record = app_module.metadata_store.get('rf_b/rf1.md')
+    assert record is not None
+
+    assert submit(client, data) is None
+    assert flashes(client)[-1] == "'rf1.md' 不存在，无法移动。"
+    assert app_module.metadata_store.get('rf_b/rf1.md') == record
+    assert app_module.search_index.search('walrus')[1][0]['path'] == 'rf_b/rf1.md'
+
+
+class InterruptedJob:
+    # 文件已移动、元数据未改时中断的任务: 检查点 moving 指向当前条目
+    def __init__(self, done):
+        self.done = done
+        self.state = {'moving': done}
+
+
+def test_interrupted_move_resumes_bookkeeping(client, app_module):
+    client.post('/mkdir', data={'dir': '', 'folder_name': 'ri_b'})
+    client.post('/create_new_file', data={'dir': '', 'new_filename': 'ri1', 'content': 'narwhal'})
+    upload_folder = app_module.UPLOAD_FOLDER
+    os.replace(os.path.join(upload_folder, 'ri1.md'), os.path.join(upload_folder, 'ri_b', 'ri1.md'))
+
+    message = app_module.move_entry('', 'ri1.md', 'ri_b', InterruptedJob(0))
+    assert message == "文件 'ri1.md' 已移动到 'ri_b'。"
+    assert app_module.metadata_store.get('ri1.md') is None
+    assert app_module.metadata_store.get('ri_b/ri1.md') is not None
+    assert app_module.search_index.search('narwhal')[1][0]['path'] == 'ri_b/ri1.md'
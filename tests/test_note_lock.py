@@ -0,0 +1,42 @@
+import threading
+
+
+def hold(lock):
+    # 在另一个线程里持有锁 (FileLock 对同一线程可重入)
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def run():
+        with lock:
+            acquired.set()
+            release.wait(10)
+    thread = threading.Thread(target=run)
+    thread.start()
+    acquired.wait(5)
+    return release, thread
+
+
+def test_saves_lock_per_note(client, app_module):
+    names = [f'nl{i}.md' for i in range(100)]
+    first = names[0]
+    other = next(name for name in names if app_module.note_lock(name) is not app_module.note_lock(first))
+    for name in (first, other):
+        client.post('/create_new_file', data={'dir': '', 'new_filename': name[:-3], 'content': 'v1'})
+
+    release, holder = hold(app_module.note_lock(first))
+    try:
+        # 其他笔记不受影响
+        client.post('/update_file', data={'dir': '', 'filename': other, 'content': 'v2'})
+        assert app_module.version_history.latest_rev(other) == 2
+
+        # 同一笔记要等锁释放
+        saver = threading.Thread(target=lambda: app_module.app.test_client().post(
+            '/update_file', data={'dir': '', 'filename': first, 'content': 'v2'}))
+        saver.start()
+        saver.join(0.5)
+        assert saver.is_alive()
+    finally:
+        release.set()
+        holder.join()
+    saver.join(10)
+    assert app_module.version_history.latest_rev(first) == 2
@@ -0,0 +1,6 @@
+from app import create_app
+
+# 生产环境入口，每个 worker 进程各自初始化，数据目录由 DATA_DIR 指定，例如:
+#   gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app
+#   waitress-serve --listen=0.0.0.0:5000 wsgi:app   (Windows)
+app = create_app()
@@ -0,0 +1,91 @@
+import os
+import zipfile
+
+import metrics
+
+# 边压缩边输出的 zip 生成器，内存占用与归档大小无关
+# zipfile 在不可 seek 的输出流上会为每个条目写 data descriptor，
+# 所以可以直接把压缩后的字节交给 HTTP 响应
+
+CHUNK_SIZE = 64 * 1024
+
+# 已经压缩过的格式再 deflate 只会浪费 CPU，直接存储
+STORED_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.ico',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar',
+    '.pdf', '.mp3', '.mp4', '.mov', '.avi', '.mkv', '.webm',
+}
+
+
+def compression_for(name):
+    ext = os.path.splitext(name)[1].lower()
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+class _Sink:
+    # 只支持 write 的输出对象，zipfile 写入的数据先暂存，由生成器取走
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_entries(base_dir, names, md_only=False):
+    # 生成 (磁盘路径, 归档内路径)；选中的文件夹会递归展开，空文件夹也保留
+    base_real = os.path.realpath(base_dir)
+    for name in names:
+        full_path = os.path.join(base_dir, name)
+        if not os.path.realpath(full_path).startswith(base_real + os.sep):
+            continue
+        if os.path.isdir(full_path):
+            for root, dirs, files in os.walk(full_path):
+                dirs.sort()
+                arc_root = os.path.relpath(root, base_dir).replace('\\', '/')
+                if not dirs and not files:
+                    yield root, arc_root + '/'
+                for file_name in sorted(files):
+                    yield os.path.join(root, file_name), f"{arc_root}/{file_name}"
+        elif os.path.isfile(full_path):
+            if md_only and not name.lower().endswith('.md'):
+                continue
+            yield full_path, name.replace('\\', '/')
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    # entries: 可迭代的 (磁盘路径, 归档内路径)；每压缩一块就产出一块
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for full_path, arcname in entries:
+            zinfo = zipfile.ZipInfo.from_file(full_path, arcname)
+            if zinfo.is_dir():
+                zf.writestr(zinfo, b'')
+            else:
+                zinfo.compress_type = compression_for(arcname)
+                with open(full_path, 'rb') as src, zf.open(zinfo, 'w') as dst:
+                    while True:
+                        buf = src.read(chunk_size)
+                        if not buf:
+                            break
+                        dst.write(buf)
+                        data = sink.drain()
+                        if data:
+                            metrics.inc('zip_bytes_streamed_total', len(data))
+                            yield data
+            data = sink.drain()
+            if data:
+                metrics.inc('zip_bytes_streamed_total', len(data))
+                yield data
+    # 中央目录
+    data = sink.drain()
+    metrics.inc('zip_bytes_streamed_total', len(data))
+    yield data